@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple
+from unittest import mock
+
+from mitmproxy import http
+from mitmproxy.test import tflow
+from tap import Tap
+
+from src.mitm.addon import AddonAllConfig, AllCategoryName, SfVipAddOn
+from src.mitm.cache import AllCached, CacheConfig
+from src.mitm.epg import EpgCallbacks, EpgConfig
+from src.mitm.utils import FlowContext
+
+from ..tools.utils.color import Ok, Title, Warn
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    channels: int = 300  # number of channels zapped through in the replayed session
+    runs: int = 5  # the best replay is kept
+    min_speedup: float = 1.2  # the shared context should make the hooks that much faster
+
+
+class Replayed(NamedTuple):
+    url: str
+    content: bytes
+    stream: bool
+
+
+def session(channels: int) -> list[Replayed]:
+    """a player zapping through XC & MAC channels with their short epg, and browsing vod"""
+    xc = "http://xc.host/player_api.php?username=user&password=pass&action="
+    mac = "http://mac.host/stalker_portal/server/load.php?type=itv&JsHttpRequest=1-xml&action="
+    categories = [dict(category_id=str(i), category_name=f"Category {i}", parent_id=0) for i in range(50)]
+    replayed: list[Replayed] = []
+    for i in range(channels):
+        replayed.append(Replayed(f"http://xc.host/live/user/pass/{i}.ts", b"", True))
+        replayed.append(Replayed(f"{xc}get_short_epg&stream_id={i}&limit=4", b'{"epg_listings": []}', False))
+        replayed.append(Replayed(f"{xc}get_vod_streams&category_id={i % 50}", b"[]", False))
+        replayed.append(Replayed(f"{mac}get_short_epg&ch_id={i}&size=10", b'{"js": []}', False))
+        replayed.append(Replayed(f"{mac}create_link&cmd=ffrt%20http://l/ch/{i}", b'{"js": {"cmd": "x"}}', False))
+    for _ in range(channels // 30):
+        replayed.append(Replayed(f"{xc}get_live_categories", json.dumps(categories).encode(), False))
+    return replayed
+
+
+def sfvip_addon(roaming: Path) -> SfVipAddOn:
+    all_config = AddonAllConfig(
+        AllCategoryName("All", "All", "All"),
+        AllCached("complete", "today", "one day", "{days} days", "fast cached"),
+        CacheConfig(14, 2, 5, 12, 100, "zstd", 3),
+    )
+    epg_callbacks = EpgCallbacks(lambda *_: None, lambda *_: None, lambda *_: None)
+    addon = SfVipAddOn(
+        {"http://m3u.host/list.m3u"}, all_config, roaming, epg_callbacks, lambda _: None, EpgConfig(5, 0)
+    )
+    addon.epg_prefer_update(False)
+    return addon
+
+
+async def replay(addon: SfVipAddOn, replayed: list[Replayed]) -> float:
+    """in us per flow, through the request, responseheaders & response hooks"""
+    total = 0.0
+    for url, content, stream in replayed:
+        flow = tflow.tflow(req=http.Request.make("GET", url))
+        response = http.Response.make(200, content)
+        start = time.perf_counter()
+        await addon.request(flow)
+        flow.response = response
+        await addon.responseheaders(flow)
+        if not stream:
+            flow.response.stream = False
+        await addon.response(flow)
+        total += time.perf_counter() - start
+    return total * 1e6 / len(replayed)
+
+
+@contextmanager
+def unshared() -> Iterator[None]:
+    """what was done before: the query is parsed & the json decoded again in each call"""
+
+    def parsed_again(cls: type[FlowContext], flow: http.HTTPFlow) -> FlowContext:
+        flow.metadata.pop(FlowContext._metadata_key, None)
+        return original(flow)
+
+    original = FlowContext.of
+    with mock.patch.object(FlowContext, "of", classmethod(parsed_again)):
+        yield
+
+
+async def run(args: Args) -> bool:
+    logging.disable(logging.WARNING)
+    replayed = session(args.channels)
+    print(Title(f"addon hooks: {len(replayed)} replayed flows"))
+    with tempfile.TemporaryDirectory() as roaming:
+        addon = sfvip_addon(Path(roaming))
+        with unshared():
+            before = min([await replay(addon, replayed) for _ in range(args.runs)])
+        after = min([await replay(addon, replayed) for _ in range(args.runs)])
+    speedup = before / after
+    ok = speedup >= args.min_speedup
+    print(f"parsed in each call: {before:.1f} us per flow")
+    print(f"shared context: {after:.1f} us per flow")
+    print(f"speedup {(Ok if ok else Warn)(f'{speedup:.2f}x')} (>= {args.min_speedup:.1f}x)")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run(Args().parse_args())) else 1)
@@ -0,0 +1,98 @@
+import sys
+import time
+from typing import Callable
+
+import msgspec
+from mitmproxy import http
+from mitmproxy.test import tflow
+from tap import Tap
+
+from src.mitm.addon import AllCategoryName, AllPanels
+from src.mitm.cache import MacCache, _MacCategories
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import mac_categories, xc_categories
+
+InjectT = Callable[[http.Response], bool]
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    categories: int = 5000  # number of categories of the responses
+    runs: int = 20  # number of responses injected in a row
+    repeats: int = 5  # the best of the runs is kept
+    min_speedup: float = 2  # the splice should be that much faster than the decode path
+
+
+def best_ms(args: Args, inject: InjectT, content: bytes) -> float:
+    """the best of the repeats, in ms per response"""
+    best = float("inf")
+    for _ in range(args.repeats):
+        duration = 0.0
+        for _ in range(args.runs):
+            response = http.Response.make(200, content)
+            start = time.perf_counter()
+            if not inject(response):
+                raise RuntimeError("Nothing injected")
+            duration += time.perf_counter() - start
+        best = min(best, duration / args.runs)
+    return best * 1000
+
+
+def xc_inject() -> InjectT:
+    panels = AllPanels(AllCategoryName(live=None, series=None, vod="All"))
+    flow = tflow.tflow()
+
+    def inject(response: http.Response) -> bool:
+        flow.response = response
+        return panels.inject_all(flow, "get_vod_categories") is not None
+
+    return inject
+
+
+def mac_inject(response: http.Response) -> bool:
+    """as MacCache.inject_all_cached_category does once the cache is probed"""
+    if (categories := _MacCategories.get_from(response)) and categories.has_all_category():
+        cached_all_category = dict(censored=0, alias="*", id=MacCache.cached_all_category, title="All cached")
+        categories.insert_after_all(response, cached_all_category)
+        return True
+    return False
+
+
+def _count(content: bytes) -> int:
+    decoded = msgspec.json.decode(content)
+    return len(decoded["js"] if isinstance(decoded, dict) else decoded)
+
+
+def injected(inject: InjectT, content: bytes) -> bool:
+    """one category more"""
+    response = http.Response.make(200, content)
+    return inject(response) and _count(response.content or b"") == _count(content) + 1
+
+
+def compare(args: Args, what: str, inject: InjectT, content: bytes, not_spliced: bytes) -> bool:
+    """the same categories in a response that can't be spliced goes through the decode path"""
+    ok = injected(inject, content) and injected(inject, not_spliced)
+    decoded = best_ms(args, inject, not_spliced)
+    spliced = best_ms(args, inject, content)
+    speedup = decoded / spliced
+    ok = ok and speedup >= args.min_speedup
+    print(f"{what}: decoded {decoded:.2f} ms, spliced {spliced:.2f} ms per response")
+    print(f"{what} speedup {(Ok if ok else Warn)(f'{speedup:.1f}x')} (>= {args.min_speedup:.0f}x)")
+    return ok
+
+
+def run(args: Args) -> bool:
+    print(Title(f"all category injection: {args.categories} categories"))
+    xc_content = xc_categories(args.categories)
+    # a category that's not an object can't be spliced
+    xc_not_spliced = b"%b,null]" % xc_content[:-1]
+    ok = compare(args, "XC get_vod_categories", xc_inject(), xc_content, xc_not_spliced)
+    mac_content = mac_categories(args.categories, MacCache.all_category)
+    # js has to come first to be spliced
+    mac_not_spliced = b'{"status":"OK",%b' % mac_content[1:]
+    return compare(args, "MAC get_categories", mac_inject, mac_content, mac_not_spliced) and ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(Args().parse_args()) else 1)
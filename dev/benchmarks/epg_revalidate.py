@@ -0,0 +1,175 @@
+import email.utils
+import gzip
+import hashlib
+import logging
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import requests
+from tap import Tap
+
+from src.mitm.cache_janitor import CacheJanitor
+from src.mitm.epg.cache import ChannelsCache
+from src.mitm.epg.update import EpgConfig, EPGProcess, EPGstatus, EPGupdate
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import xmltv
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    channels: int = 500  # number of channels of the synthetic xmltv
+    programmes: int = 100  # number of programmes per channel
+    unchanged_programmes: int = 800  # number of programmes per channel of the plain unchanged xmltv
+    max_unchanged_ratio: float = 3  # its cache hit vs downloading it to a temp file & hashing it
+
+
+class Validators(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class XmltvServer(ThreadingHTTPServer):
+    """a local stand-in for an epg provider, it answers a conditional request as told by its validators"""
+
+    def __init__(self, xmltv_gz: bytes, gzipped: bool = True) -> None:
+        self.xmltv_gz = xmltv_gz
+        self.gzipped = gzipped
+        self.validators = Validators(None, None)
+        self.sent = 0
+        super().__init__(("127.0.0.1", 0), XmltvHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/xmltv.xml{'.gz' if self.gzipped else ''}"
+
+
+class XmltvHandler(BaseHTTPRequestHandler):
+    server: XmltvServer
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def not_modified(self) -> bool:
+        etag, last_modified = self.server.validators
+        if etag:
+            return self.headers.get("If-None-Match") == etag
+        return bool(last_modified) and self.headers.get("If-Modified-Since") == last_modified
+
+    def do_GET(self) -> None:
+        etag, last_modified = self.server.validators
+        if self.not_modified():
+            self.send_response(304)
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.xmltv_gz)))
+        if etag:
+            self.send_header("ETag", etag)
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(self.server.xmltv_gz)
+        self.server.sent += len(self.server.xmltv_gz)
+
+
+class Update(NamedTuple):
+    what: str
+    validators: Validators
+    downloaded: bool
+
+
+def updates() -> list[Update]:
+    """in a row, each one starts from what's been cached by the previous ones"""
+    last_modified = email.utils.formatdate(1_700_000_000, usegmt=True)
+    modified_later = email.utils.formatdate(1_700_086_400, usegmt=True)
+    etag, last_modified_only, none = (
+        Validators('"v1"', last_modified),
+        Validators(None, modified_later),
+        Validators(None, None),
+    )
+    return [
+        Update("first update", etag, True),
+        Update("same etag", etag, False),
+        Update("last-modified only, modified later", last_modified_only, True),
+        Update("same last-modified", last_modified_only, False),
+        Update("no validators", none, True),
+        Update("no validators again, same md5", none, True),
+        Update("new etag", Validators('"v2"', last_modified), True),
+        Update("same new etag", Validators('"v2"', last_modified), False),
+    ]
+
+
+def downloaded_and_hashed(url: str) -> float:
+    """what was done before the xmltv was parsed, in s"""
+    start = time.perf_counter()
+    fingerprint = hashlib.sha1(usedforsecurity=False)
+    with requests.get(url, stream=True, timeout=30) as response, tempfile.TemporaryFile() as file:
+        for chunk in response.iter_content(chunk_size=1024 * 128):
+            fingerprint.update(chunk)
+            file.write(chunk)
+    return time.perf_counter() - start
+
+
+def unchanged(args: Args) -> bool:
+    """
+    a plain xmltv with no validators, the cache hit shouldn't wait for the xmltv to be parsed
+    the parse still shares the CPU with the local download till the xmltv is known to be the cached one
+    """
+    server = XmltvServer(xmltv(args.channels, args.unchanged_programmes), gzipped=False)
+    print(Title(f"unchanged xmltv: {len(server.xmltv_gz) / 2**20:.0f} MB plain xmltv, no validators"))
+    with tempfile.TemporaryDirectory() as roaming:
+        cache = ChannelsCache(CacheJanitor(Path(roaming), 1000))
+        epg_process = EPGProcess(lambda _: None, lambda: False)
+        config = EpgConfig(requests_timeout=30, parse_workers=0)
+        start = time.perf_counter()
+        EPGupdate.from_url(server.url, cache, epg_process, config)
+        parsed = time.perf_counter() - start
+        start = time.perf_counter()
+        update = EPGupdate.from_url(server.url, cache, epg_process, config)
+        cache_hit = time.perf_counter() - start
+    baseline = downloaded_and_hashed(server.url)
+    server.shutdown()
+    ratio = cache_hit / baseline
+    ok = bool(update and update.status == EPGstatus.READY) and ratio <= args.max_unchanged_ratio
+    print(f"first update parsed: {parsed:.2f} s")
+    print(f"downloaded to a temp file & hashed: {baseline:.2f} s")
+    hit = f"{cache_hit:.2f} s, {ratio:.1f}x"
+    print(f"cache hit: {(Ok if ok else Warn)(hit)} (<= {args.max_unchanged_ratio:.0f}x)")
+    return ok
+
+
+def run(args: Args) -> bool:
+    logging.disable(logging.WARNING)
+    server = XmltvServer(gzip.compress(xmltv(args.channels, args.programmes)))
+    print(Title(f"epg revalidation: {len(server.xmltv_gz) / 2**20:.1f} MB xmltv from {server.url}"))
+    ok = True
+    with tempfile.TemporaryDirectory() as roaming:
+        cache = ChannelsCache(CacheJanitor(Path(roaming), 1000))
+        epg_process = EPGProcess(lambda _: None, lambda: False)
+        config = EpgConfig(requests_timeout=30, parse_workers=0)
+        for what, validators, downloaded in updates():
+            server.validators, server.sent = validators, 0
+            start = time.perf_counter()
+            update = EPGupdate.from_url(server.url, cache, epg_process, config)
+            duration = time.perf_counter() - start
+            ready = bool(update and update.status == EPGstatus.READY and update.programmes)
+            channels = update.programmes.number if update and update.programmes else 0
+            update_ok = ready and channels == args.channels and bool(server.sent) == downloaded
+            ok = ok and update_ok
+            result = f"{channels} channels in {duration:.2f} s, {server.sent / 2**20:.1f} MB sent"
+            print(f"{what}: {(Ok if update_ok else Warn)(result)}")
+    server.shutdown()
+    return unchanged(args) and ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(Args().parse_args()) else 1)
@@ -0,0 +1,184 @@
+import asyncio
+import gc
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from mitmproxy import http
+from mitmproxy.test import tflow
+from tap import Tap
+
+from src.mitm.cache import AllCached, CacheConfig, MacCache, MacCacheInfo, MacQuery
+from src.mitm.cache_io import CacheIO
+from src.mitm.cache_janitor import CacheJanitor
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import LoopLag, mac_items, mac_pages
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    items: int = 100_000  # number of items of the synthetic catalog
+    page_size: int = 14  # number of items per page
+    new_items: int = 21  # number of items added at the start of the refreshed catalog
+    max_lag: float = 10  # in ms, the event loop lag not to reach
+    prefetch_workers: int = 0  # number of pages prefetched at once, no prefetch if 0
+    busy_s: float = 10  # in s, how long the lag next to a busy thread is measured, for reference
+
+
+class MacCacheBench:
+    """a MacCache in a mitmproxy like event loop with the cache I/O threads"""
+
+    server = "portal"
+
+    def __init__(self, args: Args, roaming: Path) -> None:
+        self.args = args
+        self.cache_io = CacheIO()
+        config = CacheConfig(args.page_size, args.prefetch_workers, 10, 0, 0, "gzip", 6)
+        all_cached = AllCached("complete", "today", "one day", "{days} days", "fast cached")
+        self.mac_cache = MacCache(CacheJanitor(roaming, 0), self.cache_io, lambda _: None, all_cached, config)
+        self.query = MacQuery(MacCacheBench.server, "vod")
+        self.served_pages = 0
+
+    def flow(self, category: str, page: int) -> http.HTTPFlow:
+        flow = tflow.tflow()
+        flow.request.host = MacCacheBench.server
+        flow.request.headers["host"] = MacCacheBench.server
+        flow.request.path = f"/portal.php?type=vod&action=get_ordered_list&category={category}&p={page}"
+        return flow
+
+    def pages(self, new_items: int = 0) -> list[bytes]:
+        """the items aren't kept, the GC would walk through them while the lag is measured"""
+        items = mac_items(new_items, seed=1, first_id=self.args.items) + mac_items(self.args.items)
+        return mac_pages(items, self.args.page_size)
+
+    async def walk(self, pages: list[bytes], first_page: int = 1, served: bool = False) -> int:
+        """the player's walk, the pages already cached are served by the proxy, returns the last page saved"""
+        for page, content in enumerate(pages[first_page - 1 :], first_page):
+            flow = self.flow(MacCache.all_category, page)
+            if served:
+                await self.mac_cache.resume_response(flow)
+                self.served_pages += bool(flow.response)
+            if not flow.response:
+                flow.response = http.Response.make(200, content)
+                await self.mac_cache.save_response(flow)
+            if self.query not in self.mac_cache.saved_queries:
+                return page
+        return len(pages)
+
+    async def stop(self) -> None:
+        """the player stops the walk, what's been spooled is saved"""
+        self.mac_cache.done(self.flow(MacCache.all_category, 1))
+        await self.cache_io.wait_saved(self.query)
+
+    async def load(self, page: int) -> bool:
+        """a page of the cached all category, it waits for the pending save"""
+        self.mac_cache.probed_queries[self.query] = MacCacheInfo(self.query, self.args.items, self.args.items, 1)
+        flow = self.flow(MacCache.cached_all_category, page)
+        await self.mac_cache.load_response(flow)
+        return bool(flow.response)
+
+
+BenchT = Callable[[MacCacheBench], Awaitable[bool]]
+
+
+async def baseline(bench: MacCacheBench) -> bool:
+    """the same hand-offs to the cache I/O threads without caching: what the machine itself adds"""
+    pages = bench.pages()
+    async with LoopLag() as lag:
+        for page, content in enumerate(pages, 1):
+            bench.flow(MacCache.all_category, page).response = http.Response.make(200, content)
+            await bench.cache_io.run(bench.query, len, content)
+    return lag.show(f"walk {len(pages)} pages without caching", bench.args.max_lag)
+
+
+async def busy_thread(bench: MacCacheBench) -> bool:
+    """
+    a thread that only runs python code, what the machine allows for any busy thread, not checked
+    on a single core the loop waits for it to be scheduled out, not just for the switch interval
+    """
+    stopping = threading.Event()
+
+    def _busy() -> None:
+        while not stopping.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=_busy)
+    async with LoopLag() as lag:
+        thread.start()
+        await asyncio.sleep(bench.args.busy_s)
+        stopping.set()
+    thread.join()
+    lag.show(f"a busy thread for {bench.args.busy_s:.0f} s", bench.args.max_lag)
+    return True
+
+
+async def walk_and_save(bench: MacCacheBench) -> bool:
+    pages = bench.pages()
+    async with LoopLag() as lag:
+        await bench.walk(pages)
+        loaded = await bench.load(2)
+    return lag.show(f"walk {len(pages)} pages, save & load (loaded={loaded})", bench.args.max_lag)
+
+
+async def stop_and_resume(bench: MacCacheBench) -> bool:
+    """
+    the spool is decoded again to resume the walk
+    a walk in between that misses the 1st page doesn't own the spool, it's kept to be resumed
+    """
+    pages = bench.pages()
+    stopped = len(pages) // 2
+    await bench.walk(pages[:stopped])
+    await bench.stop()
+    await bench.walk(pages[: stopped + 10], first_page=stopped + 1)
+    await bench.stop()
+    async with LoopLag() as lag:
+        await bench.walk(pages, served=True)
+    resumed = bench.served_pages == stopped - 1
+    what = f"resume @ page {stopped} ({bench.served_pages} pages served), walk & save"
+    print(f"resumed after a walk missing its 1st page: {(Ok if resumed else Warn)(str(resumed))}")
+    return lag.show(what, bench.args.max_lag) and resumed
+
+
+async def splice_stored(bench: MacCacheBench) -> bool:
+    """the stored tail is decoded again to end the walk of a refreshed catalog early"""
+    await bench.walk(bench.pages())
+    await bench.cache_io.wait_saved(bench.query)
+    pages = bench.pages(bench.args.new_items)
+    async with LoopLag() as lag:
+        saved = await bench.walk(pages)
+        loaded = await bench.load(len(pages))
+    what = f"{bench.args.new_items} new items, splice @ page {saved} of {len(pages)} & load (loaded={loaded})"
+    return lag.show(what, bench.args.max_lag)
+
+
+BENCHES: dict[str, BenchT] = {
+    "baseline": baseline,
+    "busy": busy_thread,
+    "save": walk_and_save,
+    "resume": stop_and_resume,
+    "splice": splice_stored,
+}
+
+
+async def run_all(args: Args) -> bool:
+    ok = True
+    for name, bench in BENCHES.items():
+        print(Title(f"{name}: {args.items} items"))
+        with tempfile.TemporaryDirectory() as roaming:
+            mac_cache_bench = MacCacheBench(args, Path(roaming))
+            mac_cache_bench.cache_io.start()
+            # as SfVipAddOn.running does once the proxy is running
+            gc.collect()
+            gc.freeze()
+            try:
+                ok = await bench(mac_cache_bench) and ok
+            finally:
+                mac_cache_bench.cache_io.stop()
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run_all(Args().parse_args())) else 1)
@@ -0,0 +1,72 @@
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from mitmproxy import http
+
+from src.mitm.cache import MacCache, MacCacheLoad
+
+from ..tools.utils.color import Ok, Title, Warn
+from . import mac_cache_lag
+from .utils import mac_categories
+
+
+# comments are turned into argparse help
+class Args(mac_cache_lag.Args):
+    runs: int = 20  # number of get_categories responses
+    min_speedup: float = 10  # the probe should be that much faster than a whole load
+
+
+async def timed(runs: int, run: Callable[[], Awaitable[bool]]) -> float:
+    """in ms per run"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        if not await run():
+            raise RuntimeError("Nothing found in the cache")
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+async def get_categories(args: Args, bench: mac_cache_lag.MacCacheBench) -> bool:
+    content = mac_categories(50, MacCache.all_category)
+
+    async def probed() -> bool:
+        """what's done now: only the header is read"""
+        flow = bench.flow(MacCache.all_category, 1)
+        flow.request.path = "/portal.php?type=vod&action=get_categories"
+        flow.response = http.Response.make(200, content)
+        await bench.mac_cache.inject_all_cached_category(flow)
+        return MacCache.cached_all_category.encode() in flow.response.content
+
+    async def loaded() -> bool:
+        """what was done before: the whole catalog was loaded"""
+        load = MacCacheLoad(bench.mac_cache.cache_dir, bench.query).content
+        return bool(await bench.cache_io.run(bench.query, load))
+
+    before = await timed(args.runs, loaded)
+    after = await timed(args.runs, probed)
+    speedup = before / after
+    ok = speedup >= args.min_speedup
+    print(f"whole catalog loaded: {before:.2f} ms per get_categories response")
+    print(f"header only probed: {after:.2f} ms per get_categories response")
+    print(f"speedup {(Ok if ok else Warn)(f'{speedup:.0f}x')} (>= {args.min_speedup:.0f}x)")
+    return ok
+
+
+async def run(args: Args) -> bool:
+    print(Title(f"get_categories: {args.items} items cached"))
+    with tempfile.TemporaryDirectory() as roaming:
+        bench = mac_cache_lag.MacCacheBench(args, Path(roaming))
+        bench.cache_io.start()
+        try:
+            await bench.walk(bench.pages())
+            await bench.cache_io.wait_saved(bench.query)
+            return await get_categories(args, bench)
+        finally:
+            bench.cache_io.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run(Args().parse_args())) else 1)
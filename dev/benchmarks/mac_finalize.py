@@ -0,0 +1,117 @@
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+import msgspec
+from tap import Tap
+
+from src.mitm.cache import MacItemId, decode_page_items, get_js, get_page_js
+from src.mitm.catalog import CatalogItems
+from src.mitm.utils import content_json, json_encoder
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import mac_items, mac_pages
+
+ids_decoder = msgspec.json.Decoder(list[MacItemId])
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    items: int = 100_000  # number of items of the synthetic catalog
+    page_size: int = 14  # number of items per page
+    min_speedup: float = 5  # the items kept encoded should be that much cheaper
+
+
+def measured(what: str, run: Callable[[], int]) -> tuple[float, float]:
+    """CPU time in s & peak memory in MB, run twice since tracing the allocations slows everything down"""
+    start = time.process_time()
+    n = run()
+    cpu = time.process_time() - start
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{what}: {n} items, {cpu:.2f} s CPU, peak {peak / 2**20:.0f} MB")
+    return cpu, peak / 2**20
+
+
+def pages_decoded(pages: list[bytes], spool: Path) -> int:
+    """what was done before: the items were decoded & encoded again to be spooled"""
+    items = CatalogItems()
+    with spool.open("wb") as file:
+        for content in pages:
+            js = get_js(content, dict)
+            data = js.get("data") if js else None
+            data = [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+            file.write(items.join(json_encoder.encode(item) for item in data))
+    return len(items)
+
+
+def pages_kept_encoded(pages: list[bytes], spool: Path) -> int:
+    """what's done now: the items are spooled as they are, only what's indexed is decoded"""
+    items = CatalogItems()
+    with spool.open("wb") as file:
+        for content in pages:
+            decoded = decode_page_items(content, js) if (js := get_page_js(content)) else []
+            file.write(items.join(raw for raw, _ in decoded))
+    return len(items)
+
+
+def merge_decoded(raws: list[bytes], ids: set[str]) -> int:
+    """what was done before: every loaded item was decoded & the missing ones were kept until spooled"""
+    missing: list[dict] = []
+    for raw in raws:
+        if (data := content_json(raw)) and isinstance(data, dict):
+            if (id_ := data.get("id")) and id_ not in ids:
+                missing.append(data)
+    return len(json_encoder.encode(missing)) and len(missing)
+
+
+def merge_kept_encoded(raws: list[bytes], ids: set[str], chunk: int, spool: Path) -> int:
+    """what's done now: only the ids are decoded, one chunk at a time, the missing raws are spooled"""
+    items = CatalogItems()
+    with spool.open("wb") as file:
+        for start in range(0, len(raws), chunk):
+            chunk_raws = raws[start : start + chunk]
+            decoded = ids_decoder.decode(b"[%b]" % b",".join(chunk_raws))
+            missing = [raw for raw, item in zip(chunk_raws, decoded) if item.id and item.id not in ids]
+            file.write(items.join(missing))
+    return len(items)
+
+
+def speedup(what: str, before: float, after: float, min_speedup: float) -> bool:
+    ratio = before / after if after else float("inf")
+    ok = ratio >= min_speedup
+    print(f"{what} {(Ok if ok else Warn)(f'{ratio:.1f}x')} (>= {min_speedup:.0f}x)")
+    return ok
+
+
+def run(args: Args) -> bool:
+    print(Title(f"finalize: {args.items} items by pages of {args.page_size}"))
+    pages = mac_pages(mac_items(args.items), args.page_size)
+    with tempfile.TemporaryDirectory() as tmp:
+        spool = Path(tmp) / "spool"
+        before_cpu, before_peak = measured("pages decoded & encoded again", lambda: pages_decoded(pages, spool))
+        after_cpu, after_peak = measured("pages kept encoded", lambda: pages_kept_encoded(pages, spool))
+        ok = speedup("pages CPU", before_cpu, after_cpu, args.min_speedup)
+        ok = speedup("pages peak memory", before_peak, after_peak, args.min_speedup) and ok
+
+        # a walk stopped halfway merged with the loaded catalog
+        raws = [
+            raw for content in pages if (js := get_page_js(content)) for raw, _ in decode_page_items(content, js)
+        ]
+        ids = {item.id for item in ids_decoder.decode(b"[%b]" % b",".join(raws[: len(raws) // 2]))}
+        before_cpu, before_peak = measured("merge decoded", lambda: merge_decoded(raws, ids))
+        after_cpu, after_peak = measured(
+            "merge ids only", lambda: merge_kept_encoded(raws, ids, args.page_size, spool)
+        )
+        ok = speedup("merge CPU", before_cpu, after_cpu, args.min_speedup) and ok
+        ok = speedup("merge peak memory", before_peak, after_peak, args.min_speedup) and ok
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(Args().parse_args()) else 1)
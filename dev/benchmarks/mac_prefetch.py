@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from mitmproxy import http
+
+from src.mitm.cache import MacCache
+
+from ..tools.utils.color import Ok, Title, Warn
+from . import mac_cache_lag
+
+
+# comments are turned into argparse help
+class Args(mac_cache_lag.Args):
+    items: int = 1000  # number of items of the synthetic catalog
+    prefetch_workers: int = 4  # number of pages prefetched at once
+    player_pages: int = 20  # number of pages walked by the player
+
+
+class FailingPortal(ThreadingHTTPServer):
+    """a local stand-in for a portal that fails every request"""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        super().__init__(("127.0.0.1", 0), FailingPortalHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FailingPortalHandler(BaseHTTPRequestHandler):
+    server: FailingPortal
+
+    def log_message(self, *_) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.server.requests += 1
+        self.send_response(500)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class PrefetchBench(mac_cache_lag.MacCacheBench):
+    """the pages are prefetched from the portal"""
+
+    def __init__(self, args: Args, roaming: Path, portal: FailingPortal) -> None:
+        super().__init__(args, roaming)
+        self.portal = portal
+
+    def flow(self, category: str, page: int) -> http.HTTPFlow:
+        flow = super().flow(category, page)
+        flow.request.host, flow.request.port = self.portal.server_address[:2]
+        return flow
+
+
+async def failing_portal(args: Args, bench: PrefetchBench) -> bool:
+    """the prefetch isn't started again on every player page once it's failed"""
+    for page, content in enumerate(bench.pages()[: args.player_pages], 1):
+        flow = bench.flow(MacCache.all_category, page)
+        flow.response = http.Response.make(200, content)
+        await bench.mac_cache.save_response(flow)
+        await asyncio.gather(*bench.mac_cache.prefetch_tasks)
+    ok = bench.portal.requests <= args.prefetch_workers
+    requests = f"{bench.portal.requests} upstream requests"
+    print(f"{args.player_pages} player pages: {(Ok if ok else Warn)(requests)} (<= {args.prefetch_workers})")
+    return ok
+
+
+async def run(args: Args) -> bool:
+    logging.disable(logging.WARNING)
+    print(Title(f"prefetch from a failing portal: {args.prefetch_workers} workers"))
+    portal = FailingPortal()
+    with tempfile.TemporaryDirectory() as roaming:
+        bench = PrefetchBench(args, Path(roaming), portal)
+        bench.cache_io.start()
+        try:
+            return await failing_portal(args, bench)
+        finally:
+            bench.cache_io.stop()
+            portal.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run(Args().parse_args())) else 1)
@@ -0,0 +1,127 @@
+import asyncio
+import random
+import time
+from array import array
+from typing import Optional, Self
+
+import msgspec
+
+from ..tools.utils.color import Ok, Warn
+
+
+class LoopLag:
+    """
+    the longest time the event loop wasn't available while something else runs on it
+    measured between ticks that only yield, so that it doesn't depend on the timer resolution
+    the lags are kept in an array, a list of millions of floats would be walked by each full GC collection
+    """
+
+    def __init__(self) -> None:
+        self.lags = array("d")
+        self._task: Optional[asyncio.Task] = None
+
+    async def _ticks(self) -> None:
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            self.lags.append(now - last)
+            last = now
+
+    async def __aenter__(self) -> Self:
+        self.lags = array("d")
+        self._task = asyncio.create_task(self._ticks())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        if self._task:
+            self._task.cancel()
+
+    @property
+    def max_ms(self) -> float:
+        return max(self.lags, default=0) * 1000
+
+    def over(self, max_ms: float) -> int:
+        return sum(lag * 1000 >= max_ms for lag in self.lags)
+
+    def show(self, what: str, max_ms: float) -> bool:
+        ok = self.max_ms < max_ms
+        over = f"{self.over(max_ms)} out of {len(self.lags)} ticks over"
+        print(f"{what}: max loop lag {(Ok if ok else Warn)(f'{self.max_ms:.1f} ms')} (< {max_ms:.0f} ms), {over}")
+        return ok
+
+
+def _words(rnd: random.Random, n_words: int) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rnd.choices(letters, k=rnd.randint(3, 9))) for _ in range(n_words)]
+
+
+def mac_items(n_items: int, seed: int = 0, first_id: int = 0, n_words: int = 20_000) -> list[dict]:
+    """vod items with what a portal usually sends, their titles share a vocabulary as real ones do"""
+    rnd = random.Random(seed)
+    words = _words(rnd, n_words)
+    return [
+        dict(
+            id=str(first_id + i),
+            name=" ".join(rnd.choices(words, k=rnd.randint(1, 4))).title(),
+            o_name=" ".join(rnd.choices(words, k=rnd.randint(1, 4))),
+            actors="Actor One, Actor Two",
+            year=str(1980 + i % 45),
+            added=f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:00:00",
+            rating_imdb=f"{rnd.random() * 10:.1f}",
+            description="description " * 20,
+            screenshot_uri=f"http://server/{i}.jpg",
+            genres_str="Action, Drama",
+            cmd=f"/media/{i}.mpg",
+        )
+        for i in range(n_items)
+    ]
+
+
+def mac_pages(items: list[dict], page_size: int) -> list[bytes]:
+    """the get_ordered_list pages as the portal sends them"""
+    total = len(items)
+    return [
+        msgspec.json.encode(
+            dict(js=dict(total_items=total, max_page_items=page_size, data=items[i : i + page_size]))
+        )
+        for i in range(0, total, page_size)
+    ]
+
+
+def xc_categories(n_categories: int) -> bytes:
+    """the get_*_categories response of an XC server"""
+    return msgspec.json.encode(
+        [dict(category_id=str(i), category_name=f"Category {i}", parent_id=0) for i in range(1, n_categories + 1)]
+    )
+
+
+def mac_categories(n_categories: int, all_category: str) -> bytes:
+    """the portal's categories, its all category first"""
+    categories = [dict(id=all_category, title="All", alias=all_category, censored=0)]
+    categories += [
+        dict(id=str(i), title=f"Category {i}", alias=f"cat{i}", censored=0) for i in range(n_categories)
+    ]
+    return msgspec.json.encode(dict(js=categories))
+
+
+def xmltv(n_channels: int, n_programmes: int, seed: int = 0) -> bytes:
+    """an xmltv as the epg providers send it, the programmes of each channel in a row"""
+    rnd = random.Random(seed)
+    tv = [b'<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n']
+    tv += [
+        b'<channel id="chan.%d"><display-name>Channel %d</display-name></channel>\n' % (c, c)
+        for c in range(n_channels)
+    ]
+    for c in range(n_channels):
+        for p in range(n_programmes):
+            day, hour = divmod(p, 24)
+            start = b"202610%02d%02d" % (day % 28 + 1, hour)
+            tv.append(
+                b'<programme start="%b0000 +0000" stop="%b3000 +0000" channel="chan.%d">'
+                b'<title lang="en">Title %d %d</title><desc lang="en">%b</desc></programme>\n'
+                % (start, start, c, c, p, b"desc " * rnd.randint(5, 40))
+            )
+    tv.append(b"</tv>\n")
+    return b"".join(tv)
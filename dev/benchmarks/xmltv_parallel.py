@@ -0,0 +1,78 @@
+import os
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from tap import Tap
+
+from src.mitm.epg.update import EPGProcess, EPGupdate, parse_programme, parse_programme_parallel
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import xmltv
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    channels: int = 10_000  # number of channels of the synthetic xmltv
+    programmes: int = 100  # number of programmes per channel
+    workers: list[int] = [1, 2, 4]  # numbers of worker processes to parse with
+
+
+class Parsed(NamedTuple):
+    channels: frozenset[str]
+    pickled_mb: float
+    duration: float
+    main_thread: float
+
+
+def parse(path: Path, workers: int) -> Parsed:
+    """sequential if no workers, the programmes are pickled as they're saved in the cache"""
+    epg_process = EPGProcess(lambda _: None, lambda: False)
+    channels: set[str] = set()
+    pickled = 0
+    with path.open("rb") as file_obj:
+        start, start_thread = time.perf_counter(), time.thread_time()
+        if workers:
+            # a channel cut by a fragment boundary comes in two parts already pickled
+            for named in parse_programme_parallel(file_obj, epg_process, workers, EPGupdate.parser):  # type: ignore
+                channels.add(named.name)
+                pickled += len(named.programmes)
+        else:
+            for named in parse_programme(file_obj, epg_process, EPGupdate.parser):
+                channels.add(named.name)
+                pickled += len(pickle.dumps(named.programmes))
+        duration, main_thread = time.perf_counter() - start, time.thread_time() - start_thread
+    return Parsed(frozenset(channels), pickled / 2**20, duration, main_thread)
+
+
+def run(args: Args) -> bool:
+    """the parallel parse can only be faster with a free core for each worker & one for the main process"""
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "xmltv.xml"
+        path.write_bytes(xmltv(args.channels, args.programmes))
+        size_mb = path.stat().st_size / 2**20
+        print(Title(f"xmltv parallel parse: {args.channels * args.programmes} programmes, {size_mb:.0f} MB"))
+        print(f"{cores} cores")
+        sequential = parse(path, 0)
+        print(f"sequential: {sequential.duration:.1f} s")
+        ok = len(sequential.channels) == args.channels
+        for workers in args.workers:
+            parsed = parse(path, workers)
+            same = parsed.channels == sequential.channels
+            speedup = sequential.duration / parsed.duration
+            faster = speedup > 1
+            checked = workers <= cores - 1
+            ok = ok and same and (faster or not checked)
+            wall = f"{parsed.duration:.1f} s, {speedup:.2f}x"
+            not_checked = "" if checked else f" (not checked with {cores} cores)"
+            main = f"main thread {parsed.main_thread:.1f} s, same channels {same}"
+            print(f"{workers} workers: {(Ok if faster else Warn)(wall)}{not_checked}, {main}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(Args().parse_args()) else 1)
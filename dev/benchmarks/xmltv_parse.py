@@ -0,0 +1,82 @@
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import psutil
+from tap import Tap
+
+from src.mitm.xmltv import XmltvParser, iter_xmltv
+
+from ..tools.utils.color import Ok, Title, Warn
+from .utils import xmltv
+
+
+# comments are turned into argparse help
+class Args(Tap):
+    channels: int = 2000  # number of channels of the synthetic xmltv
+    programmes: int = 100  # number of programmes per channel
+
+
+class Parsed(NamedTuple):
+    programmes: int
+    duration: float
+    rss_mb: float
+    peak_rss_mb: float
+
+
+def _peak_rss_mb() -> float:
+    if sys.platform == "win32":
+        return psutil.Process().memory_info().peak_wset / 2**20
+    import resource  # pylint: disable=import-outside-toplevel
+
+    # in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def parse(path: Path, parser: XmltvParser) -> Parsed:
+    """the peak RSS before & after the parse"""
+    rss_mb = _peak_rss_mb()
+    with path.open("rb") as file_obj:
+        start = time.perf_counter()
+        programmes = sum(not isinstance(item, str) for item in iter_xmltv(file_obj, parser))
+        duration = time.perf_counter() - start
+    return Parsed(programmes, duration, rss_mb, _peak_rss_mb())
+
+
+def write_xmltv(path: Path, n_channels: int, n_programmes: int) -> None:
+    path.write_bytes(xmltv(n_channels, n_programmes))
+
+
+def run(args: Args) -> bool:
+    """each in a spawned process, the peak RSS of this one is inherited on linux"""
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "xmltv.xml"
+        with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+            executor.submit(write_xmltv, path, args.channels, args.programmes).result()
+        size_mb = path.stat().st_size / 2**20
+        print(Title(f"xmltv parse: {args.channels * args.programmes} programmes, {size_mb:.0f} MB"))
+        parsed: dict[XmltvParser, Parsed] = {}
+        for parser in XmltvParser:
+            with ProcessPoolExecutor(1, mp_context=spawn) as executor:
+                parsed[parser] = result = executor.submit(parse, path, parser).result()
+            throughput = result.programmes / result.duration / 1000
+            peak = f"peak RSS {result.peak_rss_mb:.0f} MB (+{result.peak_rss_mb - result.rss_mb:.0f} MB)"
+            print(f"{parser.name}: {result.duration:.1f} s, {throughput:.0f}k programmes/s, {peak}")
+    iterparse, target = parsed[XmltvParser.ITERPARSE], parsed[XmltvParser.TARGET]
+    ok = target.programmes == iterparse.programmes == args.channels * args.programmes
+    faster = target.duration < iterparse.duration
+    smaller = target.peak_rss_mb < iterparse.peak_rss_mb
+    print(f"same programmes: {(Ok if ok else Warn)(str(ok))}")
+    speedup = f"{iterparse.duration / target.duration:.2f}x"
+    print(f"{XmltvParser.TARGET.name} speedup {(Ok if faster else Warn)(speedup)}")
+    print(f"{XmltvParser.TARGET.name} peak RSS {(Ok if smaller else Warn)(f'{target.peak_rss_mb:.0f} MB')}")
+    return ok and faster and smaller
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run(Args().parse_args()) else 1)
@@ -25,3 +25,13 @@ class AppDefaultConfig(ConfigLoader):
         confidence: int = 30
         requests_timeout: int = 5
         prefer_internal: bool = True
+        parse_workers: int = 0  # > 1 to parse the xmltv in worker processes, at most the number of cores - 1
+
+    class AllCache:
+        page_size: int = 1000  # 0 to serve the whole cached catalog at once
+        prefetch_workers: int = 0  # > 0 to build the cache in the background
+        requests_timeout: int = 10
+        live_max_hours: int = 168  # 0 to not cache the live channels
+        budget_mb: int = 4096  # disk budget for all the caches, EPG included, 0 for no budget
+        compression: str = "gzip"  # gzip, zstd or "" for the whole catalogs & the live channels
+        compression_level: int = 6
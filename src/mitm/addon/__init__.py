@@ -1,65 +1,92 @@
 # use separate named package to reduce what's imported by multiprocessing
-import json
+import gc
 import logging
+from functools import partial
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import Any, NamedTuple, Optional
 from urllib.parse import urlparse
 
+import msgspec
 from mitmproxy import http
 from mitmproxy.proxy.server_hooks import ServerConnectionHookData
 
-from ..cache import AllCached, MacCache, UpdateCacheProgressT
-from ..epg import EPG, EpgCallbacks
-from ..utils import APItype, get_query_key, response_json
+from ..cache import AllCached, CacheConfig, MacCache, MacLiveCache, UpdateCacheProgressT, XcCache
+from ..cache_io import CacheIO
+from ..cache_janitor import CacheJanitor
+from ..epg import EPG, EpgCallbacks, EpgConfig
+from ..utils import APItype, FlowContext, get_query_key, json_encoder
+from ..workers import CpuWorkers
 from .all import AllCategoryName, AllPanels
 
 logger = logging.getLogger(__name__)
 # logger.setLevel(logging.DEBUG)
 
 
-def fix_series_info(response: http.Response) -> None:
+# only what's read is decoded, the rest is kept as it's been encoded by the server
+class SeriesEpisode(msgspec.Struct):
+    season: Any = None
+
+
+class XcShortEpg(msgspec.Struct, rename={"programmes": "epg_listings"}):
+    programmes: Any = None
+
+
+class MacShortEpg(msgspec.Struct, rename={"programmes": "js"}):
+    programmes: Any = None
+
+
+ShortEpgT = type[XcShortEpg] | type[MacShortEpg]
+_series_info_decoder = msgspec.json.Decoder(dict[str, msgspec.Raw])
+_series_seasons_decoder = msgspec.json.Decoder(list[list[msgspec.Raw]])
+_series_episode_decoder = msgspec.json.Decoder(SeriesEpisode)
+_short_epg_decoders = {
+    XcShortEpg: msgspec.json.Decoder(XcShortEpg),
+    MacShortEpg: msgspec.json.Decoder(MacShortEpg),
+}
+
+
+def fix_series_info(flow: http.HTTPFlow) -> None:
     if (
-        response
-        and (info := response_json(response))
-        and isinstance(info, dict)
+        (response := flow.response)
+        and (info := FlowContext.of(flow).response_json(response, _series_info_decoder))
         and (episodes := info.get("episodes"))
     ):
         # fix episode list : Xtream code api recommend a dictionary
-        if isinstance(episodes, list):
-            info["episodes"] = {str(season[0]["season"]): season for season in episodes}
-            logger.info("Fix serie info")
-            response.text = json.dumps(info)
+        try:
+            if seasons := _series_seasons_decoder.decode(episodes):
+                fixed = {str(_series_episode_decoder.decode(season[0]).season): season for season in seasons}
+                logger.info("Fix serie info")
+                response.content = json_encoder.encode(info | {"episodes": fixed})
+        except (msgspec.MsgspecError, IndexError):
+            pass
 
 
 def get_short_epg(flow: http.HTTPFlow, epg: EPG, api: APItype) -> None:
     if response := flow.response:
 
-        def set_response(stream_id: str, limit: str, programmes: str) -> None:
+        def set_response(stream_id: str, limit: str, short_epg: ShortEpgT) -> None:
             # already an epg ?
-            if epg.prefer_updater.prefer_internal and (json_response := response_json(flow.response)):
-                if isinstance(json_response, dict) and json_response.get(programmes):
+            if epg.prefer_updater.prefer_internal:
+                existing = FlowContext.of(flow).response_json(response, _short_epg_decoders[short_epg])
+                if existing and existing.programmes:
                     return
             server = flow.request.host_header
             if _id := get_query_key(flow, stream_id):
                 _limit = get_query_key(flow, limit)
                 if _listing := epg.ask_epg(server, _id, _limit, api):
-                    response.text = json.dumps({programmes: _listing})
+                    response.content = json_encoder.encode(short_epg(_listing))
 
         match api:
             case APItype.XC:
-                set_response("stream_id", "limit", "epg_listings")
+                set_response("stream_id", "limit", XcShortEpg)
             case APItype.MAC:
-                set_response("ch_id", "size", "js")
+                set_response("ch_id", "size", MacShortEpg)
 
 
 def set_epg_server(flow: http.HTTPFlow, epg: EPG, api: APItype) -> None:
-    server = flow.request.host_header
-    match api:
-        case APItype.XC | APItype.MAC:
-            epg.set_server_channels(server, response_json(flow.response), api)
-        case APItype.M3U:
-            if flow.response and (content := flow.response.text):
-                epg.set_server_channels(server, content, api)
+    if flow.response:
+        # its content is decoded by a worker, while the channels are set
+        epg.set_server_channels(flow.request.host_header, flow.response, api)
 
 
 class ApiRequest:
@@ -74,7 +101,14 @@ class ApiRequest:
         self.accounts_urls = accounts_urls
 
     async def __call__(self, flow: http.HTTPFlow) -> Optional[APItype]:
-        request = flow.request
+        """checked once for each flow"""
+        context = FlowContext.of(flow)
+        if not context.api_checked:
+            context.api = self._get_api(flow.request)
+            context.api_checked = True
+        return context.api
+
+    def _get_api(self, request: http.Request) -> Optional[APItype]:
         if (components := request.path_components) and (api := ApiRequest._api.get(components[0])):
             return api
         return APItype.M3U if request.url in self.accounts_urls else None
@@ -140,6 +174,7 @@ class M3UStream:
 class AddonAllConfig(NamedTuple):
     all_name: AllCategoryName
     all_cached: AllCached
+    cache_config: CacheConfig
 
 
 class SfVipAddOn:
@@ -153,12 +188,25 @@ class SfVipAddOn:
         roaming: Path,
         epg_callbacks: EpgCallbacks,
         update_progress: UpdateCacheProgressT,
-        timeout: int,
+        epg_config: EpgConfig,
     ) -> None:
         self.api_request = ApiRequest(accounts_urls)
-        self.mac_cache = MacCache(roaming, update_progress, all_config.all_cached)
-        self.epg = EPG(roaming, epg_callbacks, timeout)
+        self.cache_janitor = CacheJanitor(roaming, all_config.cache_config.budget_mb)
+        self.cache_io = CacheIO()
+        self.workers = CpuWorkers()
+        self.mac_cache = MacCache(
+            self.cache_janitor, self.cache_io, update_progress, all_config.all_cached, all_config.cache_config
+        )
+        self.epg = EPG(self.cache_janitor, self.workers, epg_callbacks, epg_config)
+        # the epg channels are updated when the cached live channels have changed, picklable for the proxy process
+        self.mac_live_cache = MacLiveCache(
+            self.cache_janitor,
+            self.cache_io,
+            all_config.cache_config,
+            partial(set_epg_server, epg=self.epg, api=APItype.MAC),
+        )
         self.m3u_stream = M3UStream(self.epg)
+        self.xc_cache = XcCache(self.cache_janitor, self.cache_io, all_config.all_cached, all_config.cache_config)
         self.panels = AllPanels(all_config.all_name)
 
     def cache_stop_all(self) -> None:
@@ -174,12 +222,23 @@ class SfVipAddOn:
         self.epg.update_prefer(prefer_internal)
 
     def running(self) -> None:
+        # what's been loaded at start is out of the GC's reach, a full collection would walk it all again
+        # on the event loop's thread & stall the streams (~20 ms), it walks only what's been created since
+        gc.collect()
+        gc.freeze()
+        self.workers.start()
+        self.cache_io.start()
         self.mac_cache.start()
         self.epg.start()
+        self.cache_janitor.start()
 
     def done(self) -> None:
         self.epg.stop()
         self.mac_cache.stop()
+        # the pending saves are done before the janitor's manifest is written
+        self.cache_io.stop()
+        self.cache_janitor.stop()
+        self.workers.stop()
 
     def wait_running(self, timeout: int) -> bool:
         return self.epg.wait_running(timeout)
@@ -187,11 +246,17 @@ class SfVipAddOn:
     async def request(self, flow: http.HTTPFlow) -> None:
         # logger.debug("REQUEST %s", flow.request.pretty_url)
         if api := await self.api_request(flow):
-            match api, get_query_key(flow, "action"):
+            match api, FlowContext.of(flow).action:
+                case APItype.MAC, "get_ordered_list" if get_query_key(flow, "search"):
+                    await self.mac_cache.search_response(flow)
                 case APItype.MAC, "get_ordered_list":
+                    await self.mac_cache.resume_response(flow)
                     await self.mac_cache.load_response(flow)
+                case APItype.MAC, "get_all_channels":
+                    await self.mac_live_cache.load_response(flow)
                 case APItype.XC, action if action:
-                    self.panels.serve_all(flow, action)
+                    if self.panels.serve_all(flow, action):
+                        await self.xc_cache.load_response(flow, action)
 
     async def responseheaders(self, flow: http.HTTPFlow) -> None:
         """all reponses are streamed except the api requests"""
@@ -200,29 +265,40 @@ class SfVipAddOn:
             if flow.response:
                 flow.response.stream = True
 
+    async def _save_all(self, flow: http.HTTPFlow, action: str) -> None:
+        if self.panels.is_all(flow, action):
+            await self.xc_cache.save_response(flow, action)
+
     async def response(self, flow: http.HTTPFlow) -> None:
         # logger.debug("RESPONSE %s %s", flow.request.pretty_url, flow.response and flow.response.status_code)
         if not flow.response:
             return
         if not flow.response.stream:
             if api := await self.api_request(flow):
-                match api, get_query_key(flow, "action"):
+                match api, FlowContext.of(flow).action:
                     case APItype.MAC, "get_ordered_list":
                         await self.mac_cache.save_response(flow)
                     case APItype.MAC, "get_short_epg":
                         get_short_epg(flow, self.epg, api)
                     case APItype.MAC, "get_all_channels":
+                        # the epg channels are set right away with the cached live channels
+                        await self.mac_live_cache.save_response(flow)
                         set_epg_server(flow, self.epg, api)
                     case APItype.MAC, "get_categories":
-                        self.mac_cache.inject_all_cached_category(flow)
+                        await self.mac_cache.inject_all_cached_category(flow)
                     case APItype.XC, "get_series_info":
-                        fix_series_info(flow.response)
+                        await self.workers.run(fix_series_info, flow)
                     case APItype.XC, "get_live_streams":
+                        await self._save_all(flow, "get_live_streams")
                         set_epg_server(flow, self.epg, api)
                     case APItype.XC, "get_short_epg" if not get_query_key(flow, "category_id"):
                         get_short_epg(flow, self.epg, api)
                     case APItype.XC, action if action:
-                        self.panels.inject_all(flow, action)
+                        await self._save_all(flow, action)
+                        category_id = await self.workers.run(
+                            self.panels.inject_all, flow, action, self.xc_cache.title
+                        )
+                        self.panels.set_all_category_id(action, category_id)
                     case APItype.M3U, _:
                         set_epg_server(flow, self.epg, api)
         else:
@@ -232,7 +308,7 @@ class SfVipAddOn:
         # logger.debug("ERROR %s", flow.request.pretty_url)
         if not self.m3u_stream.stop(flow):
             if api := await self.api_request(flow):
-                match api, get_query_key(flow, "action"):
+                match api, FlowContext.of(flow).action:
                     case APItype.MAC, "get_ordered_list":
                         self.mac_cache.done(flow)
 
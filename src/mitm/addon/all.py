@@ -1,14 +1,17 @@
-import json
 import logging
+import re
 from dataclasses import dataclass
 from enum import Enum
-from typing import NamedTuple, Optional
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
 
+import msgspec
 from mitmproxy import http
 
-from ..utils import del_query_key, get_query_key, response_json
+from ..utils import del_query_key, get_query_key, json_array_insert, json_encoder
 
 logger = logging.getLogger(__name__)
+# the all category name for a flow & the action of its whole catalog
+AllTitleT = Callable[[http.HTTPFlow, str, str], str]
 
 
 class AllCategoryName(NamedTuple):
@@ -39,21 +42,77 @@ def _get_panel(panel_type: PanelType, all_category_name: str, streams: bool = Tr
     )
 
 
-def _unused_category_id(categories: list[dict]) -> str:
-    if ids := [
-        int(cat_id)
-        for category in categories
-        if (cat_id := category.get("category_id")) is not None and isinstance(cat_id, (int, str))
-    ]:
+class _Category(msgspec.Struct):
+    """only its id is decoded to find an unused one"""
+
+    category_id: Any = None
+
+
+class _CategoryId(msgspec.Struct):
+    """its id is decoded as an int, a numeric string included, what's not goes through the decode path"""
+
+    category_id: Optional[int] = None
+
+
+_categories_ids_decoder = msgspec.json.Decoder(list[_CategoryId], strict=False)
+_category_decoder = msgspec.json.Decoder(_Category)
+_raw_categories_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+_array_start = re.compile(rb"[ \t\n\r]*\[")
+
+
+def _unused_category_id(cat_ids: Iterable[Any]) -> str:
+    if ids := [int(cat_id) for cat_id in cat_ids if cat_id is not None and isinstance(cat_id, (int, str))]:
         return str(max(ids) + 1)
     return "0"
 
 
+def _categories_ids(raws: Iterable[msgspec.Raw]) -> Iterator[Any]:
+    for raw in raws:
+        try:
+            yield _category_decoder.decode(raw).category_id
+        except msgspec.MsgspecError:
+            pass
+
+
 def _log(verb: str, panel: Panel, action: str) -> None:
     txt = "%s '%s' category (id=%s) for '%s' request"
     logger.info(txt.capitalize(), verb.capitalize(), panel.all_category_name, panel.all_category_id, action)
 
 
+AllCategoryT = Callable[[str], dict[str, Any]]
+
+
+def _splice_all_category(response: http.Response, all_category: AllCategoryT) -> bool:
+    """the category is written in the categories array as is, only their ids are decoded"""
+    try:
+        if (
+            (content := response.content)
+            and (array_start := _array_start.match(content))
+            and (categories := _categories_ids_decoder.decode(content))
+        ):
+            ids = [category.category_id for category in categories if category.category_id is not None]
+            category_id = str(max(ids, default=-1) + 1)
+            category = json_encoder.encode(all_category(category_id))
+            if (spliced := json_array_insert(content, array_start.end() - 1, (), category)) is not None:
+                response.content = spliced
+                return True
+    except (msgspec.MsgspecError, ValueError):
+        pass
+    return False
+
+
+def _insert_all_category(response: http.Response, all_category: AllCategoryT) -> bool:
+    """for the responses that can't be spliced, the categories that aren't objects are kept as they are"""
+    try:
+        if (content := response.content) and (raws := _raw_categories_decoder.decode(content)):
+            category_id = _unused_category_id(_categories_ids(raws))
+            response.content = json_encoder.encode([all_category(category_id), *raws])
+            return True
+    except (msgspec.MsgspecError, ValueError):
+        pass
+    return False
+
+
 class AllPanels:
     def __init__(self, all_name: AllCategoryName) -> None:
         panels: list[Panel] = []
@@ -66,26 +125,35 @@ class AllPanels:
         self.category_panel = {panel.get_category: panel for panel in panels}
         self.categories_panel = {panel.get_categories: panel for panel in panels}
 
-    def inject_all(self, flow: http.HTTPFlow, action: str) -> None:
-        if (
-            action in self.categories_panel
-            and (response := flow.response)
-            and (categories := response_json(response))
-            and isinstance(categories, list)
-        ):
-            # response with the all category injected @ the beginning
+    def inject_all(self, flow: http.HTTPFlow, action: str, all_title: Optional[AllTitleT] = None) -> Optional[str]:
+        """response with the all category injected @ the beginning, its id is set on the event loop"""
+        if action in self.categories_panel and (response := flow.response):
             panel = self.categories_panel[action]
-            panel.all_category_id = _unused_category_id(categories)
-            all_category = dict(
-                category_id=panel.all_category_id,
-                category_name=panel.all_category_name,
-                parent_id=0,
-            )
-            categories.insert(0, all_category)
+            injected_id: Optional[str] = None
+
+            def all_category(category_id: str) -> dict[str, Any]:
+                nonlocal injected_id
+                injected_id = category_id
+                return dict(
+                    category_id=category_id,
+                    category_name=(
+                        all_title(flow, panel.get_category, panel.all_category_name)
+                        if all_title
+                        else panel.all_category_name
+                    ),
+                    parent_id=0,
+                )
+
+            if _splice_all_category(response, all_category) or _insert_all_category(response, all_category):
+                return injected_id
+        return None
+
+    def set_all_category_id(self, action: str, category_id: Optional[str]) -> None:
+        if category_id is not None and (panel := self.categories_panel.get(action)):
+            panel.all_category_id = category_id
             _log("inject", panel, action)
-            response.text = json.dumps(categories)
 
-    def serve_all(self, flow: http.HTTPFlow, action: str) -> None:
+    def serve_all(self, flow: http.HTTPFlow, action: str) -> bool:
         if action in self.category_panel:
             panel = self.category_panel[action]
             category_id = get_query_key(flow, "category_id")
@@ -93,3 +161,9 @@ class AllPanels:
                 # turn an all category query into a whole catalog query
                 del_query_key(flow, "category_id")
                 _log("serve", panel, action)
+                return True
+        return False
+
+    def is_all(self, flow: http.HTTPFlow, action: str) -> bool:
+        """a whole catalog query of a panel with an all category"""
+        return action in self.category_panel and get_query_key(flow, "category_id") is None
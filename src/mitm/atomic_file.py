@@ -0,0 +1,83 @@
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, NamedTuple, Optional, Self
+
+# files are written aside & swapped in once they're on disk
+# a trailer with the content length & checksum tells a complete file when it's loaded
+TmpSuffix = "tmp"
+_chunk_size = 2**20
+
+
+class Trailer(NamedTuple):
+    checksum: int
+    length: int
+    _struct = struct.Struct("<4sIQ")
+    _magic = b"SFVT"
+
+    @classmethod
+    def size(cls) -> int:
+        return cls._struct.size
+
+    @classmethod
+    def read(cls, file: IO[bytes]) -> Optional[Self]:
+        """only if it's right after the content, the file position is back at the start"""
+        try:
+            size = file.seek(0, os.SEEK_END)
+            if size >= cls._struct.size:
+                file.seek(size - cls._struct.size)
+                magic, checksum, length = cls._struct.unpack(file.read(cls._struct.size))
+                if magic == cls._magic and length == size - cls._struct.size:
+                    return cls(checksum, length)
+        except (struct.error, OSError):
+            pass
+        finally:
+            file.seek(0)
+        return None
+
+    def pack(self) -> bytes:
+        return self._struct.pack(self._magic, self.checksum, self.length)
+
+
+def _checksum(file: IO[bytes], length: int) -> int:
+    checksum = 0
+    file.seek(0)
+    while length > 0 and (chunk := file.read(min(_chunk_size, length))):
+        checksum = zlib.crc32(chunk, checksum)
+        length -= len(chunk)
+    return checksum
+
+
+def checked_length(file: IO[bytes], verify: bool = False) -> Optional[int]:
+    """the content length if the trailer is there, the checksum is only verified if asked"""
+    if (trailer := Trailer.read(file)) and (not verify or _checksum(file, trailer.length) == trailer.checksum):
+        file.seek(0)
+        return trailer.length
+    return None
+
+
+def read_checked(file: IO[bytes]) -> Optional[bytes]:
+    """the whole content if its checksum is right"""
+    if (trailer := Trailer.read(file)) and zlib.crc32(content := file.read(trailer.length)) == trailer.checksum:
+        return content
+    return None
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[IO[bytes]]:
+    """the file is replaced only if everything's been written, not on an exception"""
+    tmp_path = path.with_name(f"{path.name}.{TmpSuffix}")
+    try:
+        with tmp_path.open("w+b") as file:
+            yield file
+            length = file.seek(0, os.SEEK_END)
+            checksum = _checksum(file, length)
+            file.seek(length)
+            file.write(Trailer(checksum, length).pack())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
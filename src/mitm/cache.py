@@ -1,21 +1,50 @@
+import asyncio
+import hashlib
+import itertools
+import locale
 import logging
+import math
 import multiprocessing
 import pickle
+import re
+import threading
 import time
+from array import array
 from enum import Enum, auto
 from pathlib import Path
-from typing import IO, Any, Callable, Literal, NamedTuple, Optional, Self, TypeVar
+from typing import IO, Any, Callable, Iterable, Literal, NamedTuple, Optional, Self, TypeVar
 
+import msgspec
 from mitmproxy import http
 
 from shared.job_runner import JobRunner
 
 from ..winapi import mutex
-from .cache_cleaner import CacheCleaner
-from .utils import ProgressStep, content_json, get_int, get_query_key, json_encoder
+from .atomic_file import atomic_write, checked_length, read_checked
+from .cache_io import CacheIO
+from .cache_janitor import CacheJanitor
+from .catalog import Catalog, CatalogHeader, CatalogItems
+from .compression import Compression, Encoded, accepted_encoding
+from .prefetch import Fetcher, PagesPrefetcher
+from .search import SearchIndex
+from .utils import (
+    ProgressStep,
+    clear_by_chunks,
+    content_json,
+    get_int,
+    get_query_key,
+    json_array_insert,
+    json_encoder,
+    set_query_key,
+    sorted_by_chunks,
+)
 
 logger = logging.getLogger(__name__)
 MediaTypes = "vod", "series"
+SearchSuffix = "search"
+SpoolSuffix = "spool"
+ProgressSuffix = "progress"
+LiveSuffix = "itv"
 ValidMediaTypes = Literal["vod", "series"]
 
 
@@ -71,155 +100,618 @@ def get_js(content: Optional[bytes], wanted_type: type[T]) -> Optional[T]:
     return None
 
 
-def get_reponse_js(response: http.Response, wanted_type: type[T]) -> Optional[T]:
-    return get_js(response.content, wanted_type)
-
-
 def set_js(obj: Any) -> dict[str, Any]:
     return {"js": obj}
 
 
+class MacItem(msgspec.Struct):
+    """only what's indexed is decoded, the items are kept as they've been encoded by the server"""
+
+    id: Any = None
+    name: Any = None
+    o_name: Any = None
+    actors: Any = None
+    year: Any = None
+    added: Any = None
+    rating_imdb: Any = None
+
+
+class MacItemId(msgspec.Struct):
+    id: Any = None
+
+
+class MacPageJs(msgspec.Struct):
+    total_items: Any = None
+    max_page_items: Any = None
+    data: Optional[list[msgspec.Raw]] = None
+
+
+class MacPage(msgspec.Struct):
+    js: MacPageJs
+
+
+class MacPageItemsJs(msgspec.Struct):
+    data: Optional[list[MacItem]] = None
+
+
+class MacPageItems(msgspec.Struct):
+    js: MacPageItemsJs
+
+
+_page_decoder = msgspec.json.Decoder(MacPage)
+_page_items_decoder = msgspec.json.Decoder(MacPageItems)
+_items_decoder = msgspec.json.Decoder(list[MacItem])
+_item_decoder = msgspec.json.Decoder(MacItem)
+_ids_decoder = msgspec.json.Decoder(list[MacItemId])
+EncodedItem = tuple[bytes | msgspec.Raw, MacItem]
+
+
+def get_page_js(content: bytes) -> Optional[MacPageJs]:
+    """the page data items are left encoded"""
+    try:
+        return _page_decoder.decode(content).js
+    except msgspec.MsgspecError:
+        return None
+
+
+def _with_items(raws: list[bytes] | list[msgspec.Raw], decode: Callable[[], list[MacItem]]) -> list[EncodedItem]:
+    try:
+        if len(items := decode()) == len(raws):
+            return list(zip(raws, items))
+    except msgspec.MsgspecError:
+        pass
+    # get rid of what's not an item
+    decoded: list[EncodedItem] = []
+    for raw in raws:
+        try:
+            decoded.append((raw, _item_decoder.decode(raw)))
+        except msgspec.MsgspecError:
+            pass
+    return decoded
+
+
+def decode_page_items(content: bytes, js: MacPageJs) -> list[EncodedItem]:
+    """the page encoded items with what's indexed"""
+    return _with_items(js.data or [], lambda: _page_items_decoder.decode(content).js.data or [])
+
+
+def decode_items(raws: list[bytes], items: bytes) -> list[EncodedItem]:
+    """the encoded items with what's indexed, items are the comma separated raws"""
+    return _with_items(raws, lambda: _items_decoder.decode(b"[%b]" % items))
+
+
+def js_data_content(items: bytes, max_page_items: int, total_items: Optional[int] = None) -> bytes:
+    """same as json_encoder.encode(set_js(dict(max_page_items, total_items, data))) with already encoded items"""
+    total_items = max_page_items if total_items is None else total_items
+    return b'{"js":{"max_page_items":%d,"total_items":%d,"data":[%b]}}' % (max_page_items, total_items, items)
+
+
+def _page_range(page: int, page_size: int, total: int) -> tuple[int, int, int]:
+    """start, stop & max page items, everything in one page if page_size is not set"""
+    max_page_items = page_size if page_size > 0 else total
+    start = (max(page, 1) - 1) * max_page_items if page_size > 0 else 0
+    return start, start + max_page_items, max_page_items
+
+
+def _added_key(item: MacItem) -> str:
+    return str(item.added or "")
+
+
+def _name_key(item: MacItem) -> str:
+    return locale.strxfrm(str(item.name or "").casefold())
+
+
+def _rating_key(item: MacItem) -> float:
+    try:
+        return float(item.rating_imdb or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class MacSort(NamedTuple):
+    sortby: str
+    key: Callable[[MacItem], Any]
+    reverse: bool
+
+
+# sort indexes stored in the catalog, in that order
+MacSorts = (
+    MacSort("added", _added_key, reverse=True),
+    MacSort("name", _name_key, reverse=False),
+    MacSort("rating", _rating_key, reverse=True),
+)
+MacSortIndex = {sort.sortby: index for index, sort in enumerate(MacSorts)}
+# locale aware collation for names
+try:
+    locale.setlocale(locale.LC_COLLATE, "")
+except locale.Error:
+    pass
+
+
 def sanitize_filename(filename: str) -> str:
     for char in "/?<>\\:*|":
         filename = filename.replace(char, ".")
     return filename
 
 
+class MacCacheInfo(NamedTuple):
+    query: MacQuery
+    total: int = 0
+    actual: int = 0
+    timestamp: float = 0
+
+    @property
+    def valid(self) -> bool:
+        return bool(self.total and self.actual and self.timestamp)
+
+    @property
+    def complete(self) -> float:
+        return _in_beetween(self.actual / self.total, 0, 1) if self.total else 0
+
+
 class MacCacheFile:
     def __init__(self, cache_dir: Path, query: MacQuery) -> None:
         self.query = query
         self.file_path = cache_dir / sanitize_filename(str(self.query))
+        self.search_path = self.file_path.with_name(f"{self.file_path.name}.{SearchSuffix}")
         self.mutex = mutex.SystemWideMutex(f"file lock for {self.file_path}")
 
     def open_and_do(
-        self, mode: Literal["rb", "wb"], do: Callable[[IO[bytes]], None], *exceptions: type[Exception]
+        self,
+        mode: Literal["rb", "wb"],
+        do: Callable[[IO[bytes]], None],
+        *exceptions: type[Exception],
+        path: Optional[Path] = None,
+        verify: bool = False,
     ) -> None:
+        """written files are swapped in when complete, read files are only done if they're complete"""
         with self.mutex:
             try:
-                with self.file_path.open(mode) as file:
-                    if file:
+                if mode == "wb":
+                    with atomic_write(path or self.file_path) as file:
                         do(file)
+                else:
+                    with (path or self.file_path).open(mode) as file:
+                        if checked_length(file, verify) is not None:
+                            do(file)
             except (*exceptions, PermissionError, FileNotFoundError, OSError):
                 pass
 
+    def probe(self) -> MacCacheInfo:
+        """read only the header"""
+        infos: list[MacCacheInfo] = []
+
+        def _probe(file: IO[bytes]) -> None:
+            if header := CatalogHeader.read(file):
+                infos.append(MacCacheInfo(self.query, header.total, header.actual, header.timestamp))
+
+        self.open_and_do("rb", _probe)
+        return infos[0] if infos else MacCacheInfo(self.query)
+
 
 class MacCacheLoad(MacCacheFile):
+    """only the header is read, the items are read through a memory-mapped catalog when needed"""
+
     def __init__(self, cache_dir: Path, query: MacQuery) -> None:
-        self.total: int = 0
-        self.actual: int = 0
-        self.timestamp: float = 0
-        self.content: bytes = b""
         super().__init__(cache_dir, query)
-        self._load()
+        self.info = self.probe()
+        if self.info.valid:
+            logger.info("Load Cache from '%s' (%s out of %s)", self.file_path, self.info.actual, self.info.total)
+
+    def read(self, do: Callable[[Catalog], None]) -> None:
+        def _read(file: IO[bytes]) -> None:
+            with Catalog.open(file) as catalog:
+                if catalog and len(catalog) == self.info.actual:
+                    do(catalog)
+
+        self.open_and_do("rb", _read, ValueError)
+
+    def content(self, page: int = 1, page_size: int = 0, sortby: Optional[str] = None) -> bytes:
+        """the whole catalog or only its page if page_size is set, in the sortby order if it's been indexed"""
+        contents: list[bytes] = []
+
+        def _content(catalog: Catalog) -> None:
+            # the offset table gives the page boundaries right away
+            start, stop, max_page_items = _page_range(page, page_size, len(catalog))
+            if (sort := MacSortIndex.get(sortby or "")) is not None and sort < catalog.header.sorts:
+                items = catalog.sorted_items(sort, start, stop)
+            else:
+                items = catalog.items(start, stop)
+            contents.append(js_data_content(items, max_page_items, len(catalog)))
+
+        self.read(_content)
+        return contents[0] if contents else b""
+
+    def search_index(self) -> Optional[SearchIndex]:
+        indexes: list[SearchIndex] = []
 
-    def _load(self) -> None:
         def _load(file: IO[bytes]) -> None:
-            # pylint: disable=too-many-boolean-expressions
-            if (
-                (total := pickle.load(file))
-                and isinstance(total, int)
-                and (actual := pickle.load(file))
-                and isinstance(actual, int)
-                and (timestamp := pickle.load(file))
-                and isinstance(timestamp, float)
-                and (content := pickle.load(file))
-                and isinstance(content, bytes)
-            ):
-                self.total = total
-                self.actual = actual
-                self.timestamp = timestamp
-                self.content = content
-                logger.info("Load Cache from '%s' (%s out of %s)", file.name, self.actual, self.total)
+            if index := SearchIndex.load(file, self.info.actual, self.info.timestamp):
+                indexes.append(index)
 
-        self.open_and_do("rb", _load, pickle.PickleError, TypeError, EOFError)
+        self.open_and_do("rb", _load, pickle.PickleError, EOFError, TypeError, path=self.search_path, verify=True)
+        return indexes[0] if indexes else None
 
-    @property
-    def valid(self) -> bool:
-        return bool(self.total and self.actual and self.timestamp and self.content)
+    def found_content(self, found: list[int], page: int = 1, page_size: int = 0) -> bytes:
+        """the found items in the search ranking order"""
+        contents: list[bytes] = []
 
-    @property
-    def complete(self) -> float:
-        return _in_beetween(self.actual / self.total, 0, 1) if self.total else 0
+        def _content(catalog: Catalog) -> None:
+            start, stop, max_page_items = _page_range(page, page_size, len(found))
+            items = b",".join(catalog.item(index) for index in found[start:stop])
+            contents.append(js_data_content(items, max_page_items, len(found)))
+
+        self.read(_content)
+        return contents[0] if contents else b""
+
+
+class MacCacheProgress(NamedTuple):
+    """what's needed to resume an incomplete walk with the spooled pages"""
+
+    total: int
+    max_page_items: int
+    last_page: int
+    checksum: str
+    items: CatalogItems
+    page_ends: array
 
 
 class MacCacheSave(MacCacheFile):
+    """
+    each page's data items are appended to a spool file as soon as the page arrives
+    so that only one page is held in memory, the cache file is finalized on save
+    an incomplete walk keeps its spool & progress so that it can be resumed in a later session
+    a refresh walk stops as soon as its last pages match the stored ones, the stored tail is spliced in
+    it's updated by the cache I/O threads, one at a time, and not anymore once it's saved
+    """
+
+    _progress_version = 2
+    # consecutive pages found in the stored catalog needed to stop the walk
+    _matching_pages = 2
+
     def __init__(self, cache_dir: Path, query: MacQuery, update_progress: UpdateCacheProgressT) -> None:
         self.total: int = 0
         self.valid: bool = True
-        self.contents: list[bytes] = []
+        self.items = CatalogItems()
+        # what's indexed is held by untracked containers, or a full GC collection would walk each item's key
+        # a dict of strings & ints is untracked unlike a set, so is a tuple of strings & floats once it's examined
+        self.ids: dict[str | int, None] = {}
+        # the keys of each page
+        self.sort_keys: tuple[list[tuple], ...] = tuple([] for _ in MacSorts)
+        self.search = SearchIndex()
         self.max_pages: float = 0
+        self.max_page_items: int = 0
+        self.checksum: str = ""
+        # cumulated number of items of each spooled page
+        self.page_ends = array("I")
+        self.resumable: bool = True
+        # the spool & progress belong to this walk once it's started or resumed, not to a walk missing its 1st page
+        self.owns_spool: bool = False
+        # the stored catalog items fingerprints & their position
+        self.stored: Optional[MacCacheLoad] = None
+        self.stored_fingerprints = array("Q")
+        self.stored_positions: dict[int, int] = {}
+        self.matched_pages: int = 0
+        self.tail_start: int = 0
+        self.spliced: bool = False
+        # when prefetching only the prefetched pages are spooled
+        self.prefetching: bool = False
+        # not started again once it's failed, every player page would retry it against the portal
+        self.prefetch_failed: bool = False
         # update the progress as often as we can to avoid the progress watchdog timeout
         self.progress_step = ProgressStep(step=0)
         self.update_progress = update_progress
+        self.lock = threading.Lock()
+        self.saved: bool = False
         logger.info("Start creating Cache for %s.%s", query.server, query.type)
         super().__init__(cache_dir, query)
+        self.spool_path = self.file_path.with_name(f"{self.file_path.name}.{SpoolSuffix}")
+        self.progress_path = self.file_path.with_name(f"{self.file_path.name}.{ProgressSuffix}")
+
+    @property
+    def actual(self) -> int:
+        return len(self.items)
 
-    async def update(self, response: http.Response, page: int) -> bool:
-        if not self.valid:
+    @property
+    def last_page(self) -> int:
+        return len(self.page_ends)
+
+    def _index(self, items: Iterable[MacItem], start: int) -> None:
+        items = list(items)
+        for index, item in enumerate(items, start=start):
+            self.search.add(index, item)
+        self.ids.update(dict.fromkeys(id_ for item in items if (id_ := item.id)))
+        for sort, keys in zip(MacSorts, self.sort_keys):
+            keys.append(tuple(sort.key(item) for item in items))
+
+    def _spool(self, items: list[EncodedItem], mode: Literal["wb", "ab"]) -> bool:
+        """the items are spooled as they are, no need to encode them again"""
+        try:
+            self._index((item for _, item in items), self.actual)
+            self.owns_spool = self.owns_spool or mode == "wb"
+            with self.spool_path.open(mode) as spool:
+                spool.write(self.items.join(raw for raw, _ in items))
+            return True
+        except (PermissionError, OSError):
             return False
+
+    def _reset(self, total: int, max_page_items: int) -> None:
+        self.items = CatalogItems()
+        self.ids = {}
+        self.sort_keys = tuple([] for _ in MacSorts)
+        self.search = SearchIndex()
+        self.page_ends = array("I")
+        self.matched_pages = 0
+        self.total = total
+        self.max_page_items = max_page_items
+        self.max_pages = total / max_page_items
+
+    @property
+    def last_max_page(self) -> int:
+        return math.ceil(self.max_pages)
+
+    def update(self, response: http.Response, page: int, prefetched: bool = False) -> bool:
+        """off the event loop: the page 1 might resume the walk & the last one might splice the stored tail"""
+        with self.lock:
+            if self.saved or not self.valid or (self.prefetching and not prefetched):
+                return False
+            return self._update(response, page)
+
+    def _update(self, response: http.Response, page: int) -> bool:
         if not (content := response.content):
             logger.warning("No content for page %s for %s cache", page, str(self.query))
             self.valid = False
             return False
+        js = get_page_js(content)
+        raws = (js.data or []) if js else []
         if page == 1:
-            if (
-                (js := get_js(content, dict))
-                and (total := get_int(js.get("total_items")))
-                and (max_page_items := get_int(js.get("max_page_items")))
-            ):
-                self.contents = []
-                self.total = total
-                self.max_pages = total / max_page_items
+            if js and (total := get_int(js.total_items)) and (max_page_items := get_int(js.max_page_items)):
+                self._reset(total, max_page_items)
                 self.progress_step.set_total(self.max_pages)
                 self.update_progress(CacheProgress(CacheProgressEvent.START))
+                checksum = hashlib.md5(b",".join(raws)).hexdigest()
+                self._load_stored()
+                if self._resume(checksum):
+                    self.report_progress(page)
+                    return False
+                self.checksum = checksum
         if not self.max_pages:
             logger.warning("Missing 1st page for %s cache", str(self.query))
             self.valid = False
             return False
         # logger.info("Page %s - total %s", page, self.max_pages)
-        self.contents.append(content)
+        if page <= self.last_page:  # already spooled
+            self.report_progress(page)
+            return False
+        if page != self.last_page + 1:
+            self.resumable = False
+            self.matched_pages = 0
+        start = self.actual
+        items = decode_page_items(content, js) if js else []
+        if not self._spool(items, "wb" if page == 1 else "ab"):
+            logger.warning("Can't spool page %s for %s cache", page, str(self.query))
+            self.valid = False
+            return False
+        self.page_ends.append(self.actual)
+        self.report_progress(page)
+        if self._match_stored(start):
+            return self._splice_stored(page)
+        return page >= self.max_pages
+
+    def _load_stored(self) -> None:
+        self.stored_fingerprints = array("Q")
+        self.stored_positions = {}
+        stored = MacCacheLoad(self.file_path.parent, self.query)
+
+        def _load(catalog: Catalog) -> None:
+            self.stored_fingerprints = catalog.fingerprints()
+            self.stored_positions = {fingerprint: i for i, fingerprint in enumerate(self.stored_fingerprints)}
+            self.stored = stored
+
+        if stored.info.valid:
+            stored.read(_load)
+
+    def _match_stored(self, start: int) -> bool:
+        """are the items spooled from start found in the same order in the stored catalog ?"""
+        fingerprints = self.items.fingerprints[start:]
+        if (
+            fingerprints
+            and (position := self.stored_positions.get(fingerprints[0])) is not None
+            and self.stored_fingerprints[position : position + len(fingerprints)] == fingerprints
+        ):
+            self.matched_pages += 1
+            self.tail_start = position + len(fingerprints)
+        else:
+            self.matched_pages = 0
+        # with the stored tail the count should be right, otherwise some items have been removed further
+        tail = len(self.stored_fingerprints) - self.tail_start
+        return self.matched_pages >= MacCacheSave._matching_pages and self.actual + tail == self.total
+
+    def _splice_stored(self, page: int) -> bool:
+        """the remaining pages are already stored: new items only land on the first pages"""
+
+        def _splice(catalog: Catalog) -> None:
+            with self.spool_path.open("ab") as spool:
+                for start in range(self.tail_start, len(catalog), self.max_page_items):
+                    stop = min(start + self.max_page_items, len(catalog))
+                    raws = [catalog.item(index) for index in range(start, stop)]
+                    # items moved to the first pages are already there
+                    kept = [
+                        (raw, item)
+                        for raw, item in decode_items(raws, catalog.items(start, stop))
+                        if item.id not in self.ids
+                    ]
+                    self._index((item for _, item in kept), self.actual)
+                    spool.write(self.items.join(raw for raw, _ in kept))
+            self.spliced = True
+
+        if self.stored and self.tail_start < len(self.stored_fingerprints):
+            self.stored.read(_splice)
+            if not self.spliced:
+                logger.warning("Can't splice the stored items for %s cache", str(self.query))
+                self.valid = False
+                return False
+            logger.info("Stop creating Cache for %s @ page %s: the next pages are stored", str(self.query), page)
+        else:
+            self.spliced = True
+        # the pages boundaries are lost
+        self.resumable = False
+        return True
+
+    def report_progress(self, page: int) -> None:
         if progress := self.progress_step.progress(page):
             self.update_progress(CacheProgress(CacheProgressEvent.SHOW, progress))
-        return page >= self.max_pages
 
-    @staticmethod
-    def update_with_loaded(data_to_update: list[dict], loaded: MacCacheLoad) -> list[dict]:
+    def _load_progress(self) -> Optional[MacCacheProgress]:
+        progresses: list[MacCacheProgress] = []
+
+        def _load(file: IO[bytes]) -> None:
+            if pickle.load(file) == MacCacheSave._progress_version and isinstance(
+                progress := pickle.load(file), MacCacheProgress
+            ):
+                progresses.append(progress)
+
+        self.open_and_do(
+            "rb", _load, pickle.PickleError, EOFError, TypeError, path=self.progress_path, verify=True
+        )
+        return progresses[0] if progresses else None
+
+    def _save_progress(self) -> None:
+        def _save(file: IO[bytes]) -> None:
+            progress = MacCacheProgress(
+                self.total, self.max_page_items, self.last_page, self.checksum, self.items, self.page_ends
+            )
+            pickle.dump(MacCacheSave._progress_version, file)
+            pickle.dump(progress, file)
+            logger.info("Save Cache progress to '%s' (%s pages)", self.progress_path, self.last_page)
+
+        self.open_and_do("wb", _save, pickle.PickleError, path=self.progress_path)
+
+    def _resume(self, checksum: str) -> bool:
+        """resume if the 1st page hasn't changed since the walk stopped"""
         if (
-            (js := get_js(loaded.content, dict))
-            and (loaded_data := js.get("data"))
-            and isinstance(loaded_data, list)
-            and len(loaded_data) > len(data_to_update)
+            (progress := self._load_progress())
+            and progress.checksum == checksum
+            and progress.total == self.total
+            and progress.max_page_items == self.max_page_items
+            and progress.last_page == len(progress.page_ends)
         ):
-            ids = {id_: data for data in loaded_data if isinstance(data, dict) and (id_ := data.get("id"))}
-            ids |= {id_: data for data in data_to_update if isinstance(data, dict) and (id_ := data.get("id"))}
-            return list(ids.values())
-        return data_to_update
+            try:
+                with self.spool_path.open("r+b") as spool:
+                    # get rid of what's been merged on save
+                    spool.truncate(progress.items.size)
+                    self.items = progress.items
+                    self.page_ends = progress.page_ends
+                    self.checksum = checksum
+                    # rebuild the indexes page by page
+                    start = 0
+                    for end in self.page_ends:
+                        self._index(_items_decoder.decode(b"[%b]" % self._read_items(spool, start, end)), start)
+                        start = end
+                self.owns_spool = True
+                logger.info("Resume creating Cache for %s @ page %s", str(self.query), self.last_page + 1)
+                return True
+            except (PermissionError, OSError, msgspec.MsgspecError):
+                self._reset(self.total, self.max_page_items)
+        return False
+
+    def _read_items(self, spool: IO[bytes], start: int, end: int) -> bytes:
+        if start >= end:
+            return b""
+        offsets = self.items.offsets
+        stop = offsets[end] - 1 if end < len(offsets) else self.items.size
+        spool.seek(offsets[start])
+        return spool.read(stop - offsets[start])
+
+    def stored_page(self, page: int) -> Optional[bytes]:
+        """a page already spooled by a resumed walk or by the prefetcher, off the event loop"""
+        with self.lock:
+            if not self.saved and self.valid and 1 < page <= self.last_page:
+                try:
+                    with self.spool_path.open("rb") as spool:
+                        items = self._read_items(spool, self.page_ends[page - 2], self.page_ends[page - 1])
+                    self.report_progress(page)
+                    return js_data_content(items, self.max_page_items, self.total)
+                except (PermissionError, OSError):
+                    pass
+        return None
+
+    def spool_missing_from_loaded(self, loaded: MacCacheLoad) -> None:
+        """only the ids are decoded to find what's missing, one chunk at a time"""
+
+        def _missing(catalog: Catalog) -> None:
+            chunk = self.max_page_items or len(catalog)
+            for start in range(0, len(catalog), chunk):
+                stop = min(start + chunk, len(catalog))
+                ids = _ids_decoder.decode(b"[%b]" % catalog.items(start, stop))
+                missing = [
+                    index for index, item in enumerate(ids, start=start) if item.id and item.id not in self.ids
+                ]
+                if missing:
+                    raws = [catalog.item(index) for index in missing]
+                    self._spool(decode_items(raws, b",".join(raws)), "ab")
+
+        if loaded.info.actual > self.actual:
+            loaded.read(_missing)
+
+    def sort_indexes(self) -> list[array]:
+        """items indexes permutations, stable so that ties keep the portal order"""
+        indexes: list[array] = []
+        for sort, pages_keys in zip(MacSorts, self.sort_keys):
+            keys = list(itertools.chain.from_iterable(pages_keys))
+            indexes.append(
+                array("I", sorted_by_chunks(range(len(keys)), key=keys.__getitem__, reverse=sort.reverse))
+            )
+        return indexes
 
     def save(self, loaded: Optional[MacCacheLoad]) -> None:
         def _save(file: IO[bytes]) -> None:
-            data_to_save: list[dict] = []
-            for content in self.contents:
-                if (js := get_js(content, dict)) and (data := js.get("data")) and isinstance(data, list):
-                    data_to_save.extend(data)
-            # update with loaded if not complete
-            not_complete = len(data_to_save) < self.total
-            if not_complete and loaded and loaded.valid:
-                data_to_save = self.update_with_loaded(data_to_save, loaded)
-                timestamp = loaded.timestamp
-            else:
-                timestamp = time.time()
-            actual = len(data_to_save)
-            js = set_js(dict(max_page_items=actual, total_items=actual, data=data_to_save))
-            content = json_encoder.encode(js)
-            pickle.dump(self.total, file)
-            pickle.dump(actual, file)
-            pickle.dump(timestamp, file)
-            pickle.dump(content, file)
-            logger.info("Save Cache to '%s' (%s out of %s)", file.name, actual, self.total)
+            with self.spool_path.open("rb") as spool:
+                self.items.write(file, spool, self.total, timestamp, self.sort_indexes())
+            with atomic_write(self.search_path) as search:
+                self.search.dump(search, self.actual, timestamp)
+            logger.info("Save Cache to '%s' (%s out of %s)", self.file_path, self.actual, self.total)
+
+        # once the page being updated is done
+        with self.lock:
+            self.saved = True
+            self.update_progress(CacheProgress(CacheProgressEvent.STOP))
+            resume = False
+            if self.valid and self.total:
+                # keep what's needed to resume the walk, before the spool is updated with loaded
+                if self.last_page < self.max_pages and self.resumable and self.last_page:
+                    self._save_progress()
+                    resume = True
+                # update with loaded if not complete, before the cache file is overwritten
+                not_complete = self.actual < self.total
+                if not_complete and loaded and loaded.info.valid:
+                    self.spool_missing_from_loaded(loaded)
+                    timestamp = loaded.info.timestamp
+                else:
+                    timestamp = time.time()
+                self.open_and_do("wb", _save, pickle.PickleError, TypeError)
+            if self.owns_spool and not resume:
+                self.spool_path.unlink(missing_ok=True)
+                self.progress_path.unlink(missing_ok=True)
+            self._clear_indexes()
 
-        self.update_progress(CacheProgress(CacheProgressEvent.STOP))
-        if self.valid and self.total:
-            self.open_and_do("wb", _save, pickle.PickleError, TypeError)
+    def _clear_indexes(self) -> None:
+        """they're not needed once saved and are freed by chunks rather than all at once when dropped"""
+        clear_by_chunks(self.ids)
+        for keys in self.sort_keys:
+            clear_by_chunks(keys)
+        clear_by_chunks(self.stored_positions)
+        self.search.clear()
+
+
+class CacheConfig(NamedTuple):
+    page_size: int
+    prefetch_workers: int
+    requests_timeout: int
+    live_max_hours: int
+    budget_mb: int
+    compression: str
+    compression_level: int
 
 
 class AllCached(NamedTuple):
@@ -231,16 +723,20 @@ class AllCached(NamedTuple):
     all_names: dict[ValidMediaTypes, str] = {}
     all_updates: dict[ValidMediaTypes, str] = {}
 
-    def title(self, loaded: MacCacheLoad) -> str:
-        if loaded.complete < 1:
-            percent = _in_beetween(round(loaded.complete * 100), 1, 99)
+    def title(self, info: MacCacheInfo) -> str:
+        if info.complete < 1:
+            percent = _in_beetween(round(info.complete * 100), 1, 99)
             missing_str = f"⚠️ {self.complete.format(percent=percent)}"
         else:
             missing_str = f"✔ {self.complete.format(percent=100)}"
-        return (
-            f"{self.all_names.get(loaded.query.type, '')} - {self.fast_cached.capitalize()}"
-            f"\n{self._days_ago(loaded.timestamp)} {missing_str}"
-        )
+        return self._title(self.all_names.get(info.query.type, ""), info.timestamp, missing_str)
+
+    def complete_title(self, name: str, timestamp: float) -> str:
+        """for a whole catalog"""
+        return self._title(name, timestamp, f"✔ {self.complete.format(percent=100)}")
+
+    def _title(self, name: str, timestamp: float, missing_str: str) -> str:
+        return f"{name} - {self.fast_cached.capitalize()}\n{self._days_ago(timestamp)} {missing_str}"
 
     def _days_ago(self, timestamp: float) -> str:
         days = int((time.time() - timestamp) / (3600 * 24))
@@ -253,40 +749,183 @@ class AllCached(NamedTuple):
                 return self.several_days.format(days=days)
 
 
-class MacCache(CacheCleaner):
+class _MacCategoryId(msgspec.Struct):
+    id: Any = None
+
+
+class _MacCategoriesJs(msgspec.Struct):
+    js: list[msgspec.Raw]
+
+
+_mac_categories_decoder = msgspec.json.Decoder(_MacCategoriesJs)
+_mac_category_id_decoder = msgspec.json.Decoder(_MacCategoryId)
+_mac_js_array_start = re.compile(rb'[ \t\n\r]*\{[ \t\n\r]*"js"[ \t\n\r]*:[ \t\n\r]*\[')
+
+
+class _MacCategories(NamedTuple):
+    """
+    the categories are kept encoded when the js array can be spliced
+    otherwise they're decoded as a whole
+    """
+
+    content: bytes
+    raws: Optional[list[msgspec.Raw]] = None
+    array_start: int = -1
+    decoded: Optional[list[Any]] = None
+
+    @classmethod
+    def get_from(cls, response: http.Response) -> Optional[Self]:
+        if not (content := response.content):
+            return None
+        if array_start := _mac_js_array_start.match(content):
+            try:
+                if raws := _mac_categories_decoder.decode(content).js:
+                    return cls(content, raws, array_start.end() - 1)
+            except msgspec.MsgspecError:
+                pass
+        if decoded := get_js(content, list):
+            return cls(content, decoded=decoded)
+        return None
+
+    def has_all_category(self) -> bool:
+        if self.raws:
+            try:
+                return _mac_category_id_decoder.decode(self.raws[0]).id == MacCache.all_category
+            except msgspec.MsgspecError:
+                return False
+        return bool(
+            self.decoded
+            and (all_category := self.decoded[0])
+            and isinstance(all_category, dict)
+            and all_category.get("id") == MacCache.all_category
+        )
+
+    def insert_after_all(self, response: http.Response, category: dict[str, Any]) -> None:
+        if self.raws and (
+            spliced := json_array_insert(
+                self.content, self.array_start, self.raws[:1], json_encoder.encode(category)
+            )
+        ):
+            response.content = spliced
+        elif categories := self.decoded or get_js(self.content, list):
+            categories.insert(1, category)
+            response.content = json_encoder.encode(set_js(categories))
+
+
+class MacCache:
     cached_all_category = "cached_all_category"
     cached_header = "ListCached"
     cached_header_bytes = cached_header.encode()
     clean_after_days = 30
-    suffixes = MediaTypes
     all_category = "*"
 
-    def __init__(self, roaming: Path, update_progress: UpdateCacheProgressT, all_cached: AllCached) -> None:
-        super().__init__(roaming, MacCache.clean_after_days, *MacCache.suffixes)
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        janitor: CacheJanitor,
+        cache_io: CacheIO,
+        update_progress: UpdateCacheProgressT,
+        all_cached: AllCached,
+        config: CacheConfig,
+    ) -> None:
+        janitor.register(
+            "MacCache", MacCache.clean_after_days, MediaTypes, grouped=(SearchSuffix, SpoolSuffix, ProgressSuffix)
+        )
+        self.janitor = janitor
+        self.cache_io = cache_io
+        self.cache_dir = janitor.cache_dir
         self._stop_all_job = JobRunner[bool](self._done_all, "Cache stop all job")
         self.saved_queries_lock = multiprocessing.Lock()
         self.saved_queries: dict[MacQuery, MacCacheSave] = {}
-        self.loaded_queries: dict[MacQuery, MacCacheLoad] = {}
+        self.probed_queries: dict[MacQuery, MacCacheInfo] = {}
+        self.search_indexes: dict[MacQuery, SearchIndex] = {}
+        # max page items of the walks stopped early, their next pages are served from the cache
+        self.spliced_queries: dict[MacQuery, int] = {}
         self.update_progress = update_progress
         self.all_cached = all_cached
+        self.page_size = config.page_size
+        # the catalogs are stored as they are to be sliced in pages, only the pages sent are compressed
+        self.compression = Compression(config.compression, config.compression_level)
+        self.prefetcher = (
+            PagesPrefetcher(config.prefetch_workers, config.requests_timeout)
+            if config.prefetch_workers > 0
+            else None
+        )
+        self.prefetch_tasks: set[asyncio.Task] = set()
 
     async def save_response(self, flow: http.HTTPFlow) -> None:
         if (
             (response := flow.response)
             and get_query_key(flow, "category") == MacCache.all_category
             and (page := get_int(get_query_key(flow, "p")))
+            and not get_query_key(flow, "search")
             and MacCache.cached_header_bytes not in response.headers
             and (query := MacQuery.get_from(flow))
         ):
+            if query not in self.saved_queries:
+                # a new walk starts with what the previous one has saved
+                await self.cache_io.wait_saved(query)
             with self.saved_queries_lock:
+                if page == 1:
+                    self.spliced_queries.pop(query, None)
                 if query not in self.saved_queries:
                     self.saved_queries[query] = MacCacheSave(self.cache_dir, query, self.update_progress)
-                if await self.saved_queries[query].update(response, page):
+                saved = self.saved_queries[query]
+            # the lock isn't held while it's awaited, the walk might be stopped meanwhile
+            done = await self.cache_io.run(query, saved.update, response, page)
+            with self.saved_queries_lock:
+                if self.saved_queries.get(query) is not saved:
+                    return
+                if done:
+                    self._save(query)
+                elif (
+                    self.prefetcher
+                    and not saved.prefetching
+                    and not saved.prefetch_failed
+                    and saved.valid
+                    and saved.last_page
+                ):
+                    self._start_prefetch(flow, query, saved)
+
+    def _start_prefetch(self, flow: http.HTTPFlow, query: MacQuery, saved: MacCacheSave) -> None:
+        saved.prefetching = True
+        task = asyncio.create_task(self._prefetch(flow, query, saved))
+        # keep a reference till it's done
+        self.prefetch_tasks.add(task)
+        task.add_done_callback(self.prefetch_tasks.discard)
+
+    async def _prefetch(self, flow: http.HTTPFlow, query: MacQuery, saved: MacCacheSave) -> None:
+        async def on_page(response: http.Response, page: int) -> bool:
+            done = await self.cache_io.run(query, saved.update, response, page, True)
+            with self.saved_queries_lock:
+                # stopped ?
+                if self.saved_queries.get(query) is not saved:
+                    return True
+                if done:
                     self._save(query)
+                    return True
+                return not saved.valid
+
+        if self.prefetcher:
+            first_page, last_page = saved.last_page + 1, saved.last_max_page
+            logger.info("Prefetch pages %s to %s for %s cache", first_page, last_page, str(query))
+            if not await self.prefetcher.prefetch(flow, first_page, last_page, on_page):
+                # let the player's walk go on
+                saved.prefetch_failed = True
+                saved.prefetching = False
 
     def _save(self, query: MacQuery) -> None:
-        self.saved_queries[query].save(self.loaded_queries.get(query))
-        del self.saved_queries[query]
+        """handed to the background writer, the next pages of a spliced walk are loaded once it's saved"""
+        saved = self.saved_queries.pop(query)
+        if saved.spliced and saved.valid:
+            self.spliced_queries[query] = saved.max_page_items
+        self.cache_io.save(query, lambda: self._write(saved))
+
+    def _write(self, saved: MacCacheSave) -> None:
+        loaded = MacCacheLoad(self.cache_dir, saved.query) if saved.query in self.probed_queries else None
+        saved.save(loaded)
+        for path in saved.file_path, saved.search_path, saved.spool_path, saved.progress_path:
+            self.janitor.stored(path)
 
     def done(self, flow: http.HTTPFlow) -> None:
         with self.saved_queries_lock:
@@ -309,43 +948,390 @@ class MacCache(CacheCleaner):
     def stop(self) -> None:
         self._stop_all_job.stop()
 
+    async def resume_response(self, flow: http.HTTPFlow) -> None:
+        """serve the pages already spooled of a resumed walk or the pages of a walk stopped early"""
+        if (
+            get_query_key(flow, "category") == MacCache.all_category
+            and (page := get_int(get_query_key(flow, "p")))
+            and not get_query_key(flow, "search")
+            and (query := MacQuery.get_from(flow))
+        ):
+            with self.saved_queries_lock:
+                saved = self.saved_queries.get(query)
+                max_page_items = self.spliced_queries.get(query)
+            compress = self._compress(flow)
+            if saved and (
+                encoded := await self.cache_io.run(query, self._encoded, compress, saved.stored_page, page)
+            ):
+                flow.response = encoded_response(flow, encoded)
+                return
+            if (
+                page > 1
+                and max_page_items
+                and (
+                    encoded := await self.cache_io.run(
+                        query, self._encoded, compress, self._load, query, page, max_page_items
+                    )
+                )
+            ):
+                flow.response = encoded_response(flow, encoded)
+
+    def _compress(self, flow: http.HTTPFlow) -> bool:
+        return accepted_encoding(flow, self.compression.encoding)
+
+    def _encoded(
+        self, compress: bool, get_content: Callable[..., Optional[bytes]], *args: Any
+    ) -> Optional[Encoded]:
+        """off the event loop, the content is compressed if the player accepts it"""
+        if content := get_content(*args):
+            return self.compression.encode(content) if compress else Encoded(content)
+        return None
+
+    def _load(self, query: MacQuery, page: int, page_size: int, sortby: Optional[str] = None) -> bytes:
+        loaded = MacCacheLoad(self.cache_dir, query)
+        if content := loaded.content(page, page_size, sortby):
+            self.janitor.used(loaded.file_path)
+        return content
+
     async def load_response(self, flow: http.HTTPFlow) -> None:
         if (
             get_query_key(flow, "category") == MacCache.cached_all_category
             and (query := MacQuery.get_from(flow))
-            and (loaded := self.loaded_queries[query])
-            and (loaded.valid)
-        ):
-            flow.response = http.Response.make(
-                content=loaded.content,
-                headers={
-                    "Content-Type": "application/json",
-                    MacCache.cached_header: "",
-                },
+            and (info := self.probed_queries.get(query))
+            and info.valid
+            # the content is only loaded when it's served
+            and (
+                encoded := await self.cache_io.run(
+                    query,
+                    self._encoded,
+                    self._compress(flow),
+                    self._load,
+                    query,
+                    get_int(get_query_key(flow, "p")) or 1,
+                    self.page_size,
+                    get_query_key(flow, "sortby"),
+                )
             )
+        ):
+            flow.response = encoded_response(flow, encoded)
+
+    @staticmethod
+    def cached_response(content: bytes) -> http.Response:
+        return http.Response.make(
+            content=content,
+            headers={
+                "Content-Type": "application/json",
+                MacCache.cached_header: "",
+            },
+        )
+
+    def _search_index(self, loaded: MacCacheLoad) -> Optional[SearchIndex]:
+        """keep the search index in memory as long as it matches the cache"""
+        query, info = loaded.query, loaded.info
+        index = self.search_indexes.get(query)
+        if not (index and index.actual == info.actual and index.timestamp == info.timestamp):
+            if not (index := loaded.search_index()):
+                return None
+            self.search_indexes[query] = index
+        return index
 
-    def inject_all_cached_category(self, flow: http.HTTPFlow) -> None:
-        # pylint: disable=too-many-boolean-expressions
+    def _search(self, query: MacQuery, search: str, page: int) -> bytes:
+        # an incomplete catalog misses titles the portal has, even when it finds nothing
+        if (
+            (loaded := MacCacheLoad(self.cache_dir, query)).info.valid
+            and loaded.info.complete >= 1
+            and (index := self._search_index(loaded))
+        ):
+            found = index.search(search)
+            if content := loaded.found_content(found, page, self.page_size):
+                logger.info("Search '%s' in %s Cache: %s found", search, str(query), len(found))
+                self.janitor.used(loaded.search_path)
+                return content
+        return b""
+
+    async def search_response(self, flow: http.HTTPFlow) -> None:
+        """
+        answer the search locally with the whole cached catalog when it's complete
+        a search in any other category than the all ones is left to the portal
+        """
+        if (
+            (search := get_query_key(flow, "search"))
+            and (category := get_query_key(flow, "category"))
+            in (None, MacCache.all_category, MacCache.cached_all_category)
+            and (query := MacQuery.get_from(flow))
+        ):
+            page = get_int(get_query_key(flow, "p")) or 1
+            if encoded := await self.cache_io.run(
+                query, self._encoded, self._compress(flow), self._search, query, search, page
+            ):
+                flow.response = encoded_response(flow, encoded)
+            elif category == MacCache.cached_all_category:
+                # the portal doesn't know the cached all category
+                set_query_key(flow, "category", MacCache.all_category)
+
+    async def inject_all_cached_category(self, flow: http.HTTPFlow) -> None:
         if (
             (response := flow.response)
             and (query := MacQuery.get_from(flow))
-            and (categories := get_reponse_js(response, list))
-            and (all_category := categories[0])
-            and isinstance(all_category, dict)
-            and (all_category.get("id") == MacCache.all_category)
+            and (categories := _MacCategories.get_from(response))
+            and categories.has_all_category()
         ):
             # clean queries for other servers
-            for existing_query in self.loaded_queries.copy():
+            for existing_query in self.probed_queries.copy():
                 if existing_query.server != query.server:
-                    del self.loaded_queries[existing_query]
-            # always update the loaded query since it might have changed
-            loaded = self.loaded_queries[query] = MacCacheLoad(self.cache_dir, query)
-            if loaded.valid:
+                    del self.probed_queries[existing_query]
+            # always probe the query since it might have changed, only its header is read
+            info = self.probed_queries[query] = await self.cache_io.run(
+                query, MacCacheFile(self.cache_dir, query).probe
+            )
+            if info.valid:
                 cached_all_category = dict(
                     censored=0,
                     alias=MacCache.all_category,
                     id=MacCache.cached_all_category,
-                    title=self.all_cached.title(loaded),
+                    title=self.all_cached.title(info),
                 )
-                categories.insert(1, cached_all_category)
-                response.content = json_encoder.encode(set_js(categories))
+                categories.insert_after_all(response, cached_all_category)
+
+
+ValidContentT = Callable[[bytes], bool]
+
+
+class ResponseFile:
+    """a response content as it's been sent by the server but compressed, its age is its last modification"""
+
+    def __init__(self, cache_dir: Path, name: str, compression: Compression, valid: ValidContentT) -> None:
+        self.file_path = cache_dir / sanitize_filename(name)
+        self.compression = compression
+        self.valid = valid
+        self.mutex = mutex.SystemWideMutex(f"file lock for {self.file_path}")
+
+    def timestamp(self) -> float:
+        try:
+            return self.file_path.stat().st_mtime
+        except (PermissionError, FileNotFoundError, OSError):
+            return 0
+
+    def load(self, max_age: float = math.inf) -> Optional[Encoded]:
+        """still encoded"""
+        with self.mutex:
+            try:
+                if time.time() - self.file_path.stat().st_mtime < max_age:
+                    with self.file_path.open("rb") as file:
+                        if (content := read_checked(file)) is not None:
+                            return Encoded.stored(content)
+            except (PermissionError, FileNotFoundError, OSError):
+                pass
+        return None
+
+    def save(self, response: http.Response, stored: Optional[Encoded] = None) -> bool:
+        """
+        the response content is decoded & checked here, off the event loop
+        the previous content is swapped only once the new one is written
+        returns False if the content is not valid or already stored, only its age is updated
+        """
+        try:
+            if not ((content := response.content) and self.valid(content)):
+                return False
+        except ValueError:  # can't be decoded
+            return False
+        encoded = self.compression.encode(content)
+        with self.mutex:
+            try:
+                if encoded == stored:
+                    self.file_path.touch()
+                    return False
+                with atomic_write(self.file_path) as file:
+                    file.write(encoded.content)
+                logger.info("Save Cache to '%s'", self.file_path)
+                return True
+            except (PermissionError, FileNotFoundError, OSError):
+                logger.warning("Can't save Cache to '%s'", self.file_path)
+                return False
+
+
+def encoded_response(flow: http.HTTPFlow, encoded: Encoded) -> http.Response:
+    """the stored bytes are sent as they are if the player accepts their encoding"""
+    if encoded.encoding and accepted_encoding(flow, encoded.encoding):
+        response = MacCache.cached_response(b"")
+        response.headers["Content-Encoding"] = encoded.encoding
+        response.raw_content = encoded.content
+        response.headers["Content-Length"] = str(len(encoded.content))
+        return response
+    return MacCache.cached_response(encoded.decoded())
+
+
+def save_in_background(
+    cache_io: CacheIO,
+    janitor: CacheJanitor,
+    file: ResponseFile,
+    response: http.Response,
+    stored: Optional[Encoded] = None,
+) -> None:
+    """compressing is a lengthy job, only the last response handed for the file is saved"""
+
+    def _save() -> None:
+        if file.save(response, stored):
+            janitor.stored(file.file_path)
+
+    cache_io.save(file.file_path, _save)
+
+
+def _valid_channels(content: bytes) -> bool:
+    """only the items boundaries are checked"""
+    return bool((js := get_page_js(content)) and js.data)
+
+
+RevalidatedT = Callable[[http.HTTPFlow], None]
+
+
+class MacLiveCache:
+    """
+    the live channels list is served from the cache as long as it's fresh
+    and revalidated in the background so that the next launch gets the changes
+    """
+
+    clean_after_days = 30
+    live_type = "itv"
+
+    def __init__(
+        self, janitor: CacheJanitor, cache_io: CacheIO, config: CacheConfig, revalidated: RevalidatedT
+    ) -> None:
+        janitor.register("MacLiveCache", MacLiveCache.clean_after_days, (LiveSuffix,))
+        self.janitor = janitor
+        self.cache_io = cache_io
+        self.cache_dir = janitor.cache_dir
+        self.max_age = config.live_max_hours * 3600
+        self.timeout = config.requests_timeout
+        self.compression = Compression(config.compression, config.compression_level)
+        self.revalidated = revalidated
+        self.revalidate_tasks: set[asyncio.Task] = set()
+
+    def _live_file(self, flow: http.HTTPFlow) -> Optional[ResponseFile]:
+        if (
+            self.max_age > 0
+            and get_query_key(flow, "type") == MacLiveCache.live_type
+            and (server := flow.request.host_header)
+        ):
+            return ResponseFile(self.cache_dir, f"{server}.{LiveSuffix}", self.compression, _valid_channels)
+        return None
+
+    async def load_response(self, flow: http.HTTPFlow) -> None:
+        if (live_file := self._live_file(flow)) and (
+            stored := await self.cache_io.run(live_file.file_path, live_file.load, self.max_age)
+        ):
+            logger.info("Load live channels Cache from '%s'", live_file.file_path)
+            self.janitor.used(live_file.file_path)
+            self._start_revalidate(flow, live_file, stored)
+            flow.response = encoded_response(flow, stored)
+
+    async def save_response(self, flow: http.HTTPFlow) -> None:
+        if (
+            (response := flow.response)
+            and MacCache.cached_header_bytes not in response.headers
+            and (live_file := self._live_file(flow))
+        ):
+            save_in_background(self.cache_io, self.janitor, live_file, response)
+
+    def _start_revalidate(self, flow: http.HTTPFlow, live_file: ResponseFile, stored: Encoded) -> None:
+        task = asyncio.create_task(self._revalidate(flow, live_file, stored))
+        # keep a reference till it's done
+        self.revalidate_tasks.add(task)
+        task.add_done_callback(self.revalidate_tasks.discard)
+
+    async def _revalidate(self, flow: http.HTTPFlow, live_file: ResponseFile, stored: Encoded) -> None:
+        fetcher = Fetcher(flow, self.timeout)
+        if response := await fetcher.fetch():
+            # the changes are only known once saved
+            if await self.cache_io.run(live_file.file_path, live_file.save, response, stored):
+                self.janitor.stored(live_file.file_path)
+                logger.info("Live channels have changed for %s", flow.request.host_header)
+                revalidated_flow = fetcher.flow.copy()
+                revalidated_flow.response = response
+                self.revalidated(revalidated_flow)
+
+
+_raw_list_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+
+
+def _valid_catalog(content: bytes) -> bool:
+    """only the items boundaries are checked"""
+    try:
+        return bool(_raw_list_decoder.decode(content))
+    except msgspec.MsgspecError:
+        return False
+
+
+class XcCache:
+    """
+    the whole catalogs of the all categories are served from the cache
+    and refreshed in the background so that the next request gets the changes
+    """
+
+    clean_after_days = 30
+    actions = "get_vod_streams", "get_series", "get_live_streams"
+
+    def __init__(
+        self, janitor: CacheJanitor, cache_io: CacheIO, all_cached: AllCached, config: CacheConfig
+    ) -> None:
+        janitor.register("XcCache", XcCache.clean_after_days, XcCache.actions)
+        self.janitor = janitor
+        self.cache_io = cache_io
+        self.cache_dir = janitor.cache_dir
+        self.all_cached = all_cached
+        self.timeout = config.requests_timeout
+        self.compression = Compression(config.compression, config.compression_level)
+        self.refreshing: set[Path] = set()
+        self.refresh_tasks: set[asyncio.Task] = set()
+        self.refresh_failures: dict[Path, int] = {}
+
+    def _catalog_file(self, flow: http.HTTPFlow, action: str) -> Optional[ResponseFile]:
+        """each account gets its own catalog"""
+        if action in XcCache.actions and (server := flow.request.host_header):
+            username = get_query_key(flow, "username") or ""
+            return ResponseFile(self.cache_dir, f"{server}.{username}.{action}", self.compression, _valid_catalog)
+        return None
+
+    def title(self, flow: http.HTTPFlow, action: str, name: str) -> str:
+        if (catalog_file := self._catalog_file(flow, action)) and (timestamp := catalog_file.timestamp()):
+            return self.all_cached.complete_title(name, timestamp)
+        return name
+
+    async def load_response(self, flow: http.HTTPFlow, action: str) -> None:
+        if (catalog_file := self._catalog_file(flow, action)) and (
+            stored := await self.cache_io.run(catalog_file.file_path, catalog_file.load)
+        ):
+            logger.info("Load Cache from '%s'", catalog_file.file_path)
+            self.janitor.used(catalog_file.file_path)
+            self._start_refresh(flow, catalog_file, stored)
+            flow.response = encoded_response(flow, stored)
+
+    async def save_response(self, flow: http.HTTPFlow, action: str) -> None:
+        if (
+            (response := flow.response)
+            and MacCache.cached_header_bytes not in response.headers
+            and (catalog_file := self._catalog_file(flow, action))
+        ):
+            save_in_background(self.cache_io, self.janitor, catalog_file, response)
+
+    def _start_refresh(self, flow: http.HTTPFlow, catalog_file: ResponseFile, stored: Encoded) -> None:
+        if catalog_file.file_path not in self.refreshing:
+            self.refreshing.add(catalog_file.file_path)
+            task = asyncio.create_task(self._refresh(flow, catalog_file, stored))
+            # keep a reference till it's done
+            self.refresh_tasks.add(task)
+            task.add_done_callback(self.refresh_tasks.discard)
+
+    async def _refresh(self, flow: http.HTTPFlow, catalog_file: ResponseFile, stored: Encoded) -> None:
+        path = catalog_file.file_path
+        try:
+            response = await Fetcher(flow, self.timeout).fetch()
+            if response:
+                self.refresh_failures.pop(path, None)
+                save_in_background(self.cache_io, self.janitor, catalog_file, response, stored)
+            else:
+                # the stale catalog is served till a refresh succeeds
+                failures = self.refresh_failures[path] = self.refresh_failures.get(path, 0) + 1
+                logger.warning("Can't refresh Cache '%s' (%s failure(s) in a row)", path, failures)
+        finally:
+            self.refreshing.discard(path)
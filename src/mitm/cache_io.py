@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator, Optional, TypeVar
+
+from .workers import started_executor
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+SaveT = Callable[[], None]
+
+
+class CacheIO:
+    """
+    the cache files are read & written off the event loop so that the streams don't stall
+    loads are awaited through a thread pool, saves are handed to a background writer
+    a save still waiting for its turn is replaced by a newer one with the same key
+    a load waits for the pending save with its key so that it reads what's been saved
+    the threads are created in the proxy process
+    while they're busy the event loop waits for the GIL up to the switch interval each time it releases it,
+    it's shortened so that the streams aren't stalled by a save
+    the switch interval is set for the whole process, it's restored as soon as none of the threads is busy
+    """
+
+    _load_workers = 4
+    _switch_interval_s = 0.001
+
+    def __init__(self) -> None:
+        self._loads: Optional[ThreadPoolExecutor] = None
+        self._writer: Optional[threading.Thread] = None
+        self._condition: Optional[threading.Condition] = None
+        self._saves: dict[Hashable, SaveT] = {}
+        self._saving: Optional[Hashable] = None
+        self._stopping = False
+        self._busy_lock = threading.Lock()
+        self._busy_threads = 0
+        self._previous_switch_interval: Optional[float] = None
+
+    def start(self) -> None:
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._loads = started_executor(CacheIO._load_workers, "Cache load")
+        self._writer = threading.Thread(target=self._write, name="Cache writer")
+        self._writer.start()
+
+    def stop(self) -> None:
+        """the pending saves are done before"""
+        if self._condition and self._writer:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify_all()
+            self._writer.join()
+            self._writer = None
+        if self._loads:
+            self._loads.shutdown()
+            self._loads = None
+
+    @contextmanager
+    def _busy(self) -> Iterator[None]:
+        with self._busy_lock:
+            if self._busy_threads == 0:
+                self._previous_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(CacheIO._switch_interval_s)
+            self._busy_threads += 1
+        try:
+            yield
+        finally:
+            with self._busy_lock:
+                self._busy_threads -= 1
+                if self._busy_threads == 0 and self._previous_switch_interval is not None:
+                    sys.setswitchinterval(self._previous_switch_interval)
+                    self._previous_switch_interval = None
+
+    def save(self, key: Hashable, save: SaveT) -> None:
+        if self._condition and self._writer:
+            with self._condition:
+                if key in self._saves:
+                    logger.debug("Coalesce the pending save of %s", key)
+                self._saves[key] = save
+                self._condition.notify_all()
+        else:
+            save()
+
+    async def run(self, key: Hashable, load: Callable[..., T], *args: Any) -> T:
+        def _load() -> T:
+            self._wait_saved(key)
+            with self._busy():
+                return load(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._loads, _load)
+
+    async def wait_saved(self, key: Hashable) -> None:
+        if self._condition:
+            await asyncio.get_running_loop().run_in_executor(self._loads, self._wait_saved, key)
+
+    def _wait_saved(self, key: Hashable) -> None:
+        if self._condition:
+            with self._condition:
+                self._condition.wait_for(lambda: key not in self._saves and self._saving != key)
+
+    def _write(self) -> None:
+        assert self._condition
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._saves or self._stopping)
+                if not self._saves:
+                    break
+                # in the order they've been handed
+                self._saving = key = next(iter(self._saves))
+                save = self._saves.pop(key)
+            try:
+                with self._busy():
+                    save()
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                logger.warning("Can't save %s: %s %s", key, error.__class__.__name__, error)
+            finally:
+                # what's saved is freed now, not when the next save is handed
+                del save
+                with self._condition:
+                    self._saving = None
+                    self._condition.notify_all()
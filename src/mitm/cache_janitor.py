@@ -0,0 +1,207 @@
+import logging
+import multiprocessing
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence
+
+import msgspec
+
+from ..winapi import mutex
+from .atomic_file import TmpSuffix, atomic_write, read_checked
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(msgspec.Struct):
+    size: int
+    last_used: float
+    owner: str
+    kind: str
+
+
+class CacheKind(NamedTuple):
+    owner: str
+    max_days: int
+    # goes with the file named without this kind suffix
+    grouped: bool
+
+
+class CacheStats(NamedTuple):
+    hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    evicted_size: int = 0
+    size: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.stores} stores, "
+            f"{self.evictions} evictions ({self.evicted_size / 2**20:.1f} MB), {self.size / 2**20:.1f} MB"
+        )
+
+
+_manifest_decoder = msgspec.json.Decoder(dict[str, CacheEntry])
+_manifest_encoder = msgspec.json.Encoder()
+
+
+class CacheJanitor:
+    """
+    one janitor for all the caches, it keeps a manifest of their files & when they've been used
+    it runs once in the background after startup, evicting the expired files
+    and the least recently used ones over the disk budget
+    """
+
+    manifest_name = "manifest.json"
+    _start_delay_s = 10
+    _tmp_max_days = 1
+
+    def __init__(self, roaming: Path, budget_mb: int) -> None:
+        self.cache_dir = Path(roaming) / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.cache_dir / CacheJanitor.manifest_name
+        self.budget = budget_mb * 2**20
+        self.kinds: dict[str, CacheKind] = {}
+        # files used in this session, not evicted
+        self.used_files: dict[str, CacheEntry] = {}
+        self.stats = CacheStats()
+        self._lock = multiprocessing.Lock()
+        self._stopping = multiprocessing.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def register(self, owner: str, max_days: int, kinds: Sequence[str], grouped: Sequence[str] = ()) -> None:
+        for kind in kinds:
+            self.kinds[kind] = CacheKind(owner, max_days, grouped=False)
+        for kind in grouped:
+            self.kinds[kind] = CacheKind(owner, max_days, grouped=True)
+
+    def _use(self, path: Path) -> bool:
+        if cache_kind := self.kinds.get(kind := path.suffix.replace(".", "")):
+            try:
+                size = path.stat().st_size
+            except (PermissionError, FileNotFoundError, OSError):
+                return False
+            with self._lock:
+                self.used_files[path.name] = CacheEntry(size, time.time(), cache_kind.owner, kind)
+            return True
+        return False
+
+    def used(self, path: Path) -> None:
+        """a cache hit"""
+        if self._use(path):
+            with self._lock:
+                self.stats = self.stats._replace(hits=self.stats.hits + 1)
+
+    def stored(self, path: Path) -> None:
+        if self._use(path):
+            with self._lock:
+                self.stats = self.stats._replace(stores=self.stats.stores + 1)
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._sweeper = threading.Thread(target=self._sweep_after_startup)
+        self._sweeper.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._sweeper:
+            self._sweeper.join()
+            self._sweeper = None
+        self._update_manifest(sweep=False)
+        logger.info("Caches: %s", self.stats)
+
+    def _sweep_after_startup(self) -> None:
+        if not self._stopping.wait(CacheJanitor._start_delay_s):
+            self._update_manifest(sweep=True)
+            logger.info("Caches: %s", self.stats)
+
+    def _load_manifest(self) -> dict[str, CacheEntry]:
+        try:
+            with self.manifest_path.open("rb") as file:
+                if content := read_checked(file):
+                    return _manifest_decoder.decode(content)
+        except (PermissionError, FileNotFoundError, OSError, msgspec.MsgspecError):
+            pass
+        return {}
+
+    def _update_manifest(self, sweep: bool) -> None:
+        with mutex.SystemWideMutex(f"file lock for {self.manifest_path}"):
+            manifest = self._load_manifest()
+            with self._lock:
+                used_files = dict(self.used_files)
+            for name, entry in used_files.items():
+                if (stored := manifest.get(name)) is None or stored.last_used < entry.last_used:
+                    manifest[name] = entry
+            manifest = self._sweep(manifest, used_files) if sweep else manifest
+            try:
+                with atomic_write(self.manifest_path) as file:
+                    file.write(_manifest_encoder.encode(manifest))
+            except (PermissionError, OSError):
+                logger.warning("Can't save %s", self.manifest_path)
+
+    def _remove(self, file: Path) -> bool:
+        try:
+            file.unlink(missing_ok=True)
+            return True
+        except (PermissionError, OSError):
+            logger.warning("Can't remove %s", file)
+            return False
+
+    def _sweep(self, manifest: dict[str, CacheEntry], used_files: dict[str, CacheEntry]) -> dict[str, CacheEntry]:
+        """only the files found are kept in the manifest"""
+        now = time.time()
+        files: dict[str, CacheEntry] = {}
+        for file in self.cache_dir.iterdir():
+            kind = file.suffix.replace(".", "")
+            try:
+                stat = file.stat()
+            except (PermissionError, FileNotFoundError, OSError):
+                continue
+            if kind == TmpSuffix:
+                # left by an interrupted write
+                if (now - stat.st_mtime) / (3600 * 24) >= CacheJanitor._tmp_max_days:
+                    self._remove(file)
+            elif cache_kind := self.kinds.get(kind):
+                # the access time is not reliably updated
+                entry = manifest.get(file.name)
+                last_used = max(entry.last_used if entry else 0, stat.st_mtime)
+                if file.name in used_files or (now - last_used) / (3600 * 24) < cache_kind.max_days:
+                    files[file.name] = CacheEntry(stat.st_size, last_used, cache_kind.owner, kind)
+                elif self._remove(file):
+                    self._evicted(stat.st_size)
+        self._evict_over_budget(files, used_files)
+        with self._lock:
+            self.stats = self.stats._replace(size=sum(entry.size for entry in files.values()))
+        return files
+
+    def _group(self, name: str) -> str:
+        path = Path(name)
+        if (cache_kind := self.kinds.get(path.suffix.replace(".", ""))) and cache_kind.grouped:
+            return path.stem
+        return name
+
+    def _evict_over_budget(self, files: dict[str, CacheEntry], used_files: dict[str, CacheEntry]) -> None:
+        """the least recently used groups of files first"""
+        size = sum(entry.size for entry in files.values())
+        if self.budget <= 0 or size <= self.budget:
+            return
+        groups: dict[str, list[str]] = {}
+        for name in files:
+            groups.setdefault(self._group(name), []).append(name)
+        for names in sorted(groups.values(), key=lambda names: max(files[name].last_used for name in names)):
+            if size <= self.budget:
+                break
+            if any(name in used_files for name in names):
+                continue
+            for name in names:
+                if self._remove(self.cache_dir / name):
+                    entry = files.pop(name)
+                    size -= entry.size
+                    self._evicted(entry.size)
+                    logger.info("Evict %s cache %s", entry.owner, name)
+
+    def _evicted(self, size: int) -> None:
+        with self._lock:
+            self.stats = self.stats._replace(
+                evictions=self.stats.evictions + 1, evicted_size=self.stats.evicted_size + size
+            )
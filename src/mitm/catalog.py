@@ -0,0 +1,171 @@
+import hashlib
+import mmap
+import shutil
+import struct
+from array import array
+from contextlib import contextmanager
+from typing import IO, Iterable, Iterator, NamedTuple, Optional, Self, Sequence
+
+from .atomic_file import Trailer
+
+# A versioned binary catalog: header | items | offsets | fingerprints | sort indexes
+# items are json objects separated by commas so that any range of items is a single slice
+# offsets are the start of each item in the items region followed by a sentinel
+# fingerprints are the hashes of each item to tell what's changed since it's been stored
+# each sort index is a permutation of the items indexes
+# the file ends with the trailer of an atomic write
+
+
+def fingerprint(item: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(item, digest_size=CatalogItems.fingerprint_size).digest(), "little")
+
+
+class CatalogHeader(NamedTuple):
+    total: int
+    actual: int
+    timestamp: float
+    items_size: int
+    sorts: int = 0
+    _struct = struct.Struct("<4sHHIIdQ")
+    _magic = b"SFVC"
+    _version = 2
+
+    @classmethod
+    def size(cls) -> int:
+        return cls._struct.size
+
+    @classmethod
+    def read(cls, file: IO[bytes]) -> Optional[Self]:
+        try:
+            magic, version, sorts, *values = cls._struct.unpack(file.read(cls._struct.size))
+            if magic == cls._magic and version == cls._version:
+                return cls(*values, sorts=sorts)
+        except struct.error:
+            pass
+        return None
+
+    def pack(self) -> bytes:
+        return self._struct.pack(
+            self._magic, self._version, self.sorts, self.total, self.actual, self.timestamp, self.items_size
+        )
+
+    @property
+    def fingerprints_pos(self) -> int:
+        return self.size() + self.items_size + CatalogItems.offset_size * (self.actual + 1)
+
+    @property
+    def sorts_pos(self) -> int:
+        return self.fingerprints_pos + CatalogItems.fingerprint_size * self.actual
+
+    @property
+    def file_size(self) -> int:
+        return self.sorts_pos + CatalogItems.index_size * self.actual * self.sorts
+
+
+class CatalogItems:
+    """keep track of the items offsets while they're written elsewhere"""
+
+    offset_size = 8
+    fingerprint_size = 8
+    index_size = 4
+
+    def __init__(self) -> None:
+        self.offsets = array("Q")
+        self.fingerprints = array("Q")
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def join(self, items: Iterable[bytes]) -> bytes:
+        """returns the items to be appended to the items region"""
+        chunks: list[bytes] = []
+        for item in items:
+            if self.offsets:
+                chunks.append(b",")
+                self.size += 1
+            self.offsets.append(self.size)
+            self.fingerprints.append(fingerprint(item))
+            chunks.append(item)
+            self.size += len(item)
+        return b"".join(chunks)
+
+    def write(
+        self, file: IO[bytes], items_file: IO[bytes], total: int, timestamp: float, sorts: Sequence[array] = ()
+    ) -> None:
+        file.write(CatalogHeader(total, len(self), timestamp, self.size, len(sorts)).pack())
+        shutil.copyfileobj(items_file, file)
+        offsets = array("Q", self.offsets)
+        offsets.append(self.size + 1)  # sentinel
+        if offsets.itemsize != CatalogItems.offset_size:
+            raise TypeError("Unexpected offset size")
+        offsets.tofile(file)
+        if self.fingerprints.itemsize != CatalogItems.fingerprint_size or len(self.fingerprints) != len(self):
+            raise TypeError("Unexpected fingerprints")
+        self.fingerprints.tofile(file)
+        for indexes in sorts:
+            if indexes.itemsize != CatalogItems.index_size or len(indexes) != len(self):
+                raise TypeError("Unexpected sort index")
+            indexes.tofile(file)
+
+
+class Catalog:
+    """memory-mapped read only access to a catalog"""
+
+    def __init__(self, header: CatalogHeader, mapped: mmap.mmap) -> None:
+        self.header = header
+        self._mapped = mapped
+        self._items_pos = header.size()
+        self._offsets_pos = self._items_pos + header.items_size
+
+    @classmethod
+    @contextmanager
+    def open(cls, file: IO[bytes]) -> Iterator[Optional[Self]]:
+        if (header := CatalogHeader.read(file)) and header.actual:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if len(mapped) == header.file_size + Trailer.size():
+                    yield cls(header, mapped)
+                    return
+        yield None
+
+    def __len__(self) -> int:
+        return self.header.actual
+
+    def _offset(self, index: int) -> int:
+        return struct.unpack_from("<Q", self._mapped, self._offsets_pos + CatalogItems.offset_size * index)[0]
+
+    def items(self, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """comma separated items in [start, stop)"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return b""
+        pos = self._items_pos
+        return self._mapped[pos + self._offset(start) : pos + self._offset(stop) - 1]
+
+    def item(self, index: int) -> bytes:
+        return self.items(index, index + 1)
+
+    def fingerprints(self) -> array:
+        fingerprints = array("Q")
+        pos = self.header.fingerprints_pos
+        fingerprints.frombytes(self._mapped[pos : pos + CatalogItems.fingerprint_size * len(self)])
+        return fingerprints
+
+    def sorted_items(self, sort: int, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """comma separated items in [start, stop) of the sort index"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop or not 0 <= sort < self.header.sorts:
+            return b""
+        pos = self.header.sorts_pos + CatalogItems.index_size * (sort * len(self) + start)
+        indexes = struct.unpack_from(f"<{stop - start}I", self._mapped, pos)
+        return b",".join(self.item(index) for index in indexes)
+
+    def __iter__(self) -> Iterator[bytes]:
+        pos = self._items_pos
+        offsets = self._offsets_pos
+        start = self._offset(0)
+        for stop in struct.iter_unpack(
+            "<Q", self._mapped[offsets + CatalogItems.offset_size : self.header.fingerprints_pos]
+        ):
+            yield self._mapped[pos + start : pos + stop[0] - 1]
+            start = stop[0]
@@ -0,0 +1,47 @@
+import gzip
+from typing import NamedTuple, Optional, Self
+
+import zstandard  # comes with mitmproxy
+from mitmproxy import http
+
+# the stored encoding is told by its magic bytes
+_magics = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+
+class Encoded(NamedTuple):
+    content: bytes
+    encoding: str = ""
+
+    def decoded(self) -> bytes:
+        match self.encoding:
+            case "gzip":
+                return gzip.decompress(self.content)
+            case "zstd":
+                return zstandard.ZstdDecompressor().decompressobj().decompress(self.content)
+        return self.content
+
+    @classmethod
+    def stored(cls, content: bytes) -> Self:
+        for encoding, magic in _magics.items():
+            if content.startswith(magic):
+                return cls(content, encoding)
+        return cls(content)
+
+
+class Compression(NamedTuple):
+    encoding: str
+    level: int
+
+    def encode(self, content: bytes) -> Encoded:
+        """deterministic so that the encoded contents can be compared"""
+        match self.encoding:
+            case "gzip":
+                return Encoded(gzip.compress(content, compresslevel=self.level, mtime=0), "gzip")
+            case "zstd":
+                return Encoded(zstandard.ZstdCompressor(level=self.level).compress(content), "zstd")
+        return Encoded(content)
+
+
+def accepted_encoding(flow: http.HTTPFlow, encoding: str) -> bool:
+    accepted: Optional[str] = flow.request.headers.get("accept-encoding")
+    return bool(accepted and encoding in (value.split(";")[0].strip() for value in accepted.split(",")))
@@ -1,15 +1,18 @@
 import logging
 import multiprocessing
 import time
-from pathlib import Path
-from typing import Any, Callable, Iterator, NamedTuple, Optional
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from mitmproxy import http
 
 from shared.job_runner import JobRunner
 
+from ..cache_janitor import CacheJanitor
 from ..utils import APItype, get_int
+from ..workers import CpuWorkers
 from .programme import EPGprogramme, EPGprogrammeM3U, EPGprogrammeMAC, EPGprogrammeXC
 from .server import EPGserverChannels
-from .update import EPGupdater, FoundProgammes, UpdateStatusT
+from .update import EpgConfig, EPGupdater, FoundProgammes, UpdateStatusT
 
 logger = logging.getLogger(__name__)
 
@@ -76,9 +79,12 @@ class EPG:
     _m3u_server = "m3u.server"
 
     # all following methods should be called from the same process EXCEPT add_job & wait_running
-    def __init__(self, roaming: Path, callbacks: EpgCallbacks, timeout: int) -> None:
+    def __init__(
+        self, janitor: CacheJanitor, workers: CpuWorkers, callbacks: EpgCallbacks, config: EpgConfig
+    ) -> None:
         self.servers: dict[str, EPGserverChannels] = {}
-        self.updater = EPGupdater(roaming, callbacks.update_status, timeout)
+        self.workers = workers
+        self.updater = EPGupdater(janitor, callbacks.update_status, config)
         self.confidence_updater = ConfidenceUpdater()
         self.prefer_updater = PreferUpdater()
         self.show_channel = callbacks.show_channel
@@ -108,11 +114,11 @@ class EPG:
         self.prefer_updater.stop()
         self.confidence_updater.stop()
 
-    def set_server_channels(self, server: Optional[str], channels: Any, api: APItype) -> None:
+    def set_server_channels(self, server: Optional[str], response: http.Response, api: APItype) -> None:
         if server:
             if api == APItype.M3U:
                 server = EPG._m3u_server
-            self.servers[server] = EPGserverChannels(server, channels, api)
+            self.servers[server] = EPGserverChannels(server, response, api, self.workers)
 
     @staticmethod
     def _get_listing(
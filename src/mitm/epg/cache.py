@@ -1,14 +1,14 @@
 import logging
 import os
 import pickle
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import IO, Iterator, KeysView, Literal, NamedTuple, Optional, Sequence
-
-from shared.md5 import compute_md5
+from typing import IO, Callable, Iterator, KeysView, Literal, Mapping, NamedTuple, Optional, Self, Sequence
 
 from ...winapi import mutex
-from ..cache_cleaner import CacheCleaner
+from ..atomic_file import atomic_write, checked_length
+from ..cache_janitor import CacheJanitor
+from ..utils import get_int
 from .programme import InternalProgramme
 
 logger = logging.getLogger(__name__)
@@ -17,7 +17,8 @@ ProgrammesT = Sequence[InternalProgramme]
 
 
 class NamedProgrammes(NamedTuple):
-    programmes: ProgrammesT
+    # or already pickled
+    programmes: ProgrammesT | bytes
     name: str
 
 
@@ -29,26 +30,53 @@ class FilePosition(NamedTuple):
 PositionsT = dict[str, list[FilePosition]]
 
 
-class CacheFile(CacheCleaner):
+class XmltvValidators(NamedTuple):
+    """of the xmltv response, to revalidate it with a conditional request"""
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> Self:
+        return cls(headers.get("ETag"), headers.get("Last-Modified"), get_int(headers.get("Content-Length")))
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class XmltvInfo(NamedTuple):
+    fingerprint: str
+    validators: XmltvValidators
+
+
+GetXmltvInfoT = Callable[[], XmltvInfo]
+
+
+class CacheFile:
     clean_after_days = 5
     suffix = ""
 
-    def __init__(self, roaming: Path, url: str) -> None:
-        super().__init__(roaming, CacheFile.clean_after_days, self.suffix)
-        self.roaming = roaming
+    def __init__(self, cache_dir: Path, url: str) -> None:
         for repl in ("://", "/"):
             url = url.replace(repl, ".")
-        self.path = self.cache_dir / f"{url}.{self.suffix}"
+        self.path = cache_dir / f"{url}.{self.suffix}"
         self.mutex = mutex.SystemWideMutex(f"file lock for {self.path}")
 
     @contextmanager
     def open(self, mode: Literal["rb", "wb"]) -> Iterator[Optional[IO[bytes]]]:
-        with self.mutex:
+        """a written file is swapped in only when it's complete, not when an exception is raised"""
+        with self.mutex, ExitStack() as stack:
             try:
-                with self.path.open(mode=mode) as f:
-                    yield f
+                f = stack.enter_context(atomic_write(self.path) if mode == "wb" else self.path.open(mode=mode))
             except (PermissionError, FileNotFoundError, OSError):
-                yield None
+                f = None
+            yield f
 
 
 class EPGCacheFile(CacheFile):
@@ -60,9 +88,10 @@ class PRGCacheFile(CacheFile):
 
 
 class ChannelProgrammes:
-    def __init__(self, cache_file: CacheFile, positions: PositionsT) -> None:
+    def __init__(self, cache_file: CacheFile, positions: PositionsT, xmltv: XmltvInfo) -> None:
         self.cache_file = cache_file
         self.positions: PositionsT = positions
+        self.xmltv = xmltv
 
     @property
     def all_names(self) -> KeysView[str]:
@@ -92,9 +121,12 @@ class ChannelProgrammes:
         return ()
 
     @staticmethod
-    def add_programmes(f: IO[bytes], programmes: ProgrammesT) -> FilePosition:
+    def add_programmes(f: IO[bytes], programmes: ProgrammesT | bytes) -> FilePosition:
         seek = f.tell()
-        pickle.dump(programmes, f)
+        if isinstance(programmes, bytes):
+            f.write(programmes)
+        else:
+            pickle.dump(programmes, f)
         length = f.tell() - seek
         return FilePosition(seek, length)
 
@@ -102,64 +134,102 @@ class ChannelProgrammes:
     def valid_position(position: FilePosition, length: int) -> bool:
         return 0 <= position.seek <= length and 0 <= position.seek + position.length <= length
 
-    @staticmethod
-    def length(f: IO[bytes]) -> int:
-        f.seek(0, os.SEEK_END)
-        return f.tell()
+
+class _Discarded(Exception):
+    """the files being written aren't swapped in"""
 
 
 class ChannelsCache:
     chunk_size = 1024
-
-    def __init__(self, roaming: Path) -> None:
-        self.roaming = roaming
-
-    def load(self, xml: Path, url: str) -> Optional[ChannelProgrammes]:
-        epg = EPGCacheFile(self.roaming, url)
-        prg = PRGCacheFile(self.roaming, url)
+    # both files are swapped one after the other, the same pairing tells they've been saved together
+    pairing_size = 8
+
+    def __init__(self, janitor: CacheJanitor) -> None:
+        # both files go with the same url
+        janitor.register("EPG", CacheFile.clean_after_days, (), grouped=(EPGCacheFile.suffix, PRGCacheFile.suffix))
+        self.janitor = janitor
+
+    def load(self, url: str) -> Optional[ChannelProgrammes]:
+        """with the info of the xmltv they've been processed from"""
+        epg = EPGCacheFile(self.janitor.cache_dir, url)
+        prg = PRGCacheFile(self.janitor.cache_dir, url)
         with epg.open("rb") as f_epg, prg.open("rb") as f_prg:
             if f_epg and f_prg:
-                if positions := self.pickle_load(f_epg, f_prg, xml):
-                    return ChannelProgrammes(prg, positions)
+                if loaded := self.pickle_load(f_epg, f_prg):
+                    self.janitor.used(epg.path)
+                    self.janitor.used(prg.path)
+                    xmltv, positions = loaded
+                    return ChannelProgrammes(prg, positions, xmltv)
         return None
 
     def save(
-        self, xml: Path, url: str, channels: Iterator[Optional[NamedProgrammes]]
+        self, url: str, channels: Iterator[Optional[NamedProgrammes]], get_xmltv: GetXmltvInfoT
     ) -> Optional[ChannelProgrammes]:
-        epg = EPGCacheFile(self.roaming, url)
-        prg = PRGCacheFile(self.roaming, url)
-        with epg.open("wb") as f_epg, prg.open("wb") as f_prg:
+        """the xmltv info is asked once all the channels are there, the existing files are kept if one is None"""
+        epg = EPGCacheFile(self.janitor.cache_dir, url)
+        prg = PRGCacheFile(self.janitor.cache_dir, url)
+        programmes: Optional[ChannelProgrammes] = None
+        try:
+            with epg.open("wb") as f_epg, prg.open("wb") as f_prg:
+                if f_epg and f_prg:
+                    if not (dumped := self.pickle_dump(f_epg, f_prg, channels, get_xmltv)):
+                        raise _Discarded
+                    xmltv, positions = dumped
+                    programmes = ChannelProgrammes(prg, positions, xmltv)
+        except _Discarded:
+            pass
+        if programmes:
+            # once they've been swapped in
+            self.janitor.stored(epg.path)
+            self.janitor.stored(prg.path)
+        return programmes
+
+    def update_xmltv(self, url: str, programmes: ChannelProgrammes, xmltv: XmltvInfo) -> None:
+        """the same channels from an xmltv with other validators, only its info is written"""
+        epg = EPGCacheFile(self.janitor.cache_dir, url)
+        with epg.open("wb") as f_epg, programmes.cache_file.open("rb") as f_prg:
             if f_epg and f_prg:
-                if positions := self.pickle_dump(f_epg, f_prg, xml, channels):
-                    return ChannelProgrammes(prg, positions)
-                f_epg.truncate(0)  # clear
-                f_prg.truncate(0)  # clear
-        return None
+                self.pickle_dump_epg(f_epg, xmltv, f_prg.read(ChannelsCache.pairing_size), programmes.positions)
+                programmes.xmltv = xmltv
+        if programmes.xmltv is xmltv:
+            self.janitor.stored(epg.path)
+
+    @staticmethod
+    def pickle_dump_epg(f_epg: IO[bytes], xmltv: XmltvInfo, pairing: bytes, all_positions: PositionsT) -> None:
+        pickle.dump(xmltv, f_epg)
+        pickle.dump(pairing, f_epg)
+        pickle.dump(len(all_positions), f_epg)
+        pickle.dump(all_positions, f_epg)
 
     @staticmethod
     def pickle_dump(
-        f_epg: IO[bytes], f_prg: IO[bytes], xml: Path, channels: Iterator[Optional[NamedProgrammes]]
-    ) -> Optional[PositionsT]:
+        f_epg: IO[bytes], f_prg: IO[bytes], channels: Iterator[Optional[NamedProgrammes]], get_xmltv: GetXmltvInfoT
+    ) -> Optional[tuple[XmltvInfo, PositionsT]]:
         try:
+            pairing = os.urandom(ChannelsCache.pairing_size)
+            f_prg.write(pairing)
             all_positions: PositionsT = {}
             for channel in channels:
                 if not channel:
                     return None
                 position = ChannelProgrammes.add_programmes(f_prg, channel.programmes)
                 all_positions.setdefault(channel.name, []).append(position)
-            pickle.dump(compute_md5(xml), f_epg)
-            pickle.dump(len(all_positions), f_epg)
-            pickle.dump(all_positions, f_epg)
-            return all_positions
+            xmltv = get_xmltv()
+            ChannelsCache.pickle_dump_epg(f_epg, xmltv, pairing, all_positions)
+            return xmltv, all_positions
         except pickle.PickleError:
             return None
 
     @staticmethod
-    def pickle_load(f_epg: IO[bytes], f_prg: IO[bytes], xml: Path) -> Optional[PositionsT]:
+    def pickle_load(f_epg: IO[bytes], f_prg: IO[bytes]) -> Optional[tuple[XmltvInfo, PositionsT]]:
         try:
-            md5 = pickle.load(f_epg)
-            if isinstance(md5, str) and md5 == compute_md5(xml):
-                length_prg = ChannelProgrammes.length(f_prg)
+            if (
+                checked_length(f_epg, verify=True) is not None
+                and (length_prg := checked_length(f_prg)) is not None
+                and isinstance(xmltv := pickle.load(f_epg), XmltvInfo)
+                and isinstance(xmltv.validators, XmltvValidators)
+                and pickle.load(f_epg) == f_prg.read(ChannelsCache.pairing_size)
+            ):
                 n_all_positions = pickle.load(f_epg)
                 all_positions = pickle.load(f_epg)
                 if (
@@ -174,7 +244,7 @@ class ChannelsCache:
                         for position in positions
                     )
                 ):
-                    return all_positions
+                    return xmltv, all_positions
             return None
         except (pickle.PickleError, EOFError):
             return None
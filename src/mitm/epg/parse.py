@@ -0,0 +1,24 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator
+
+from ..xmltv import FragmentT, ReadT, XmltvParser, XmltvSplitter, parse_fragment
+
+
+def parse_in_parallel(read: ReadT, workers: int, fragment_size: int, parser: XmltvParser) -> Iterator[FragmentT]:
+    """the fragments are parsed by a pool of processes, they're given back in the xmltv order"""
+    splitter = XmltvSplitter(read, fragment_size)
+    # spawned as on Windows, the workers only import the xmltv package
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    parsing: deque[Future[FragmentT]] = deque()
+    try:
+        for fragment in splitter.fragments():
+            parsing.append(pool.submit(parse_fragment, splitter.header, fragment, parser))
+            # not too many fragments waiting in memory
+            if len(parsing) > workers * 2:
+                yield parsing.popleft().result()
+        while parsing:
+            yield parsing.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -3,14 +3,12 @@ import logging
 from datetime import datetime
 from typing import NamedTuple, Optional, Self
 
-logger = logging.getLogger(__name__)
+import msgspec
 
+# built by the xmltv workers processes
+from ..xmltv import InternalProgramme
 
-class InternalProgramme(NamedTuple):
-    start: str
-    stop: str
-    title: str
-    desc: str
+logger = logging.getLogger(__name__)
 
 
 class Schedule(NamedTuple):
@@ -48,7 +46,15 @@ class Schedule(NamedTuple):
         return self._get_hour(self.end)
 
 
-class EPGprogrammeXC(dict[str, str]):
+# encoded as the servers do, in their fields order
+class EPGprogrammeXC(msgspec.Struct):
+    title: str
+    description: str
+    start_timestamp: str
+    stop_timestamp: str
+    start: str
+    end: str
+
     @classmethod
     def from_programme(cls, programme: InternalProgramme, now: float) -> Optional[Self]:
         if schedule := Schedule.from_programme(programme, now):
@@ -67,7 +73,15 @@ class EPGprogrammeXC(dict[str, str]):
         return base64.b64encode(text.replace("\\", "").encode()).decode()
 
 
-class EPGprogrammeMAC(dict[str, str | int]):
+class EPGprogrammeMAC(msgspec.Struct):
+    name: str
+    descr: str
+    duration: int
+    start_timestamp: str
+    stop_timestamp: str
+    time: str
+    time_to: str
+
     @classmethod
     def from_programme(cls, programme: InternalProgramme, now: float) -> Optional[Self]:
         if schedule := Schedule.from_programme(programme, now):
@@ -87,6 +101,7 @@ class EPGprogrammeMAC(dict[str, str | int]):
         return text.replace("\\", "")
 
 
+# sent to the ui process
 class EPGprogrammeM3U(NamedTuple):
     title: str
     descr: str
@@ -2,11 +2,14 @@ import logging
 import threading
 from typing import Any, Callable, Generic, Iterable, Iterator, Optional, Self, TypeVar
 
+import msgspec
 from ipytv import playlist
 from ipytv.channel import IPTVChannel
 from ipytv.exceptions import IPyTVException
+from mitmproxy import http
 
 from ..utils import APItype
+from ..workers import CpuWorkers
 
 logger = logging.getLogger(__name__)
 T = TypeVar("T")
@@ -46,45 +49,89 @@ class StreamTo(Generic[T]):
         return self
 
 
-def xc_stream_to(channels: Any) -> Optional[StreamTo]:
-    if isinstance(channels, list):
+# only the needed fields of the channels are decoded
+class XcChannel(msgspec.Struct):
+    stream_id: Any = None
+    epg_channel_id: Any = None
+    name: Any = None
 
-        def get_stream_id(channel: dict) -> Any:
-            return channel.get("stream_id")
 
-        def get_epg_id(channel: dict) -> Any:
-            return channel.get("epg_channel_id")
+class MacChannel(msgspec.Struct):
+    id: Any = None
+    xmltv_id: Any = None
+    name: Any = None
 
-        def get_name(channel: dict) -> Iterator[Any]:
-            yield channel.get("name")
 
-        return StreamTo[dict](get_stream_id, get_epg_id, get_name).populate(channels, dict)
-    return None
+class MacChannelsJs(msgspec.Struct):
+    data: Optional[list[msgspec.Raw]] = None
+
+
+class MacChannels(msgspec.Struct):
+    js: Optional[MacChannelsJs] = None
+
 
+_xc_channels_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+_mac_channels_decoder = msgspec.json.Decoder(MacChannels)
+_xc_channel_decoder = msgspec.json.Decoder(XcChannel)
+_mac_channel_decoder = msgspec.json.Decoder(MacChannel)
 
-def mac_stream_to(channels: Any) -> Optional[StreamTo]:
-    if (
-        isinstance(channels, dict)
-        and (js := channels.get("js"))
-        and isinstance(js, dict)
-        and (channels := js.get("data"))
-        and isinstance(channels, list)
-    ):
 
-        def get_stream_id(channel: dict) -> Any:
-            return channel.get("id")
+def _decode_channels(raws: Iterable[msgspec.Raw], decoder: msgspec.json.Decoder[T]) -> Iterator[T]:
+    """one at a time so that the GIL is released in between, channels that aren't objects are skipped"""
+    for raw in raws:
+        try:
+            yield decoder.decode(raw)
+        except msgspec.MsgspecError:
+            pass
+
+
+def xc_stream_to(response: http.Response) -> Optional[StreamTo]:
+    try:
+        if (content := response.content) and (raws := _xc_channels_decoder.decode(content)):
 
-        def get_epg_id(channel: dict) -> Any:
-            return channel.get("xmltv_id")
+            def get_stream_id(channel: XcChannel) -> Any:
+                return channel.stream_id
 
-        def get_name(channel: dict) -> Iterator[Any]:
-            yield channel.get("name")
+            def get_epg_id(channel: XcChannel) -> Any:
+                return channel.epg_channel_id
 
-        return StreamTo[dict](get_stream_id, get_epg_id, get_name).populate(channels, dict)
+            def get_name(channel: XcChannel) -> Iterator[Any]:
+                yield channel.name
+
+            return StreamTo[XcChannel](get_stream_id, get_epg_id, get_name).populate(
+                _decode_channels(raws, _xc_channel_decoder), XcChannel
+            )
+    except (msgspec.MsgspecError, ValueError):
+        pass
+    return None
+
+
+def mac_stream_to(response: http.Response) -> Optional[StreamTo]:
+    try:
+        if (
+            (content := response.content)
+            and (js := _mac_channels_decoder.decode(content).js)
+            and (raws := js.data)
+        ):
+
+            def get_stream_id(channel: MacChannel) -> Any:
+                return channel.id
+
+            def get_epg_id(channel: MacChannel) -> Any:
+                return channel.xmltv_id
+
+            def get_name(channel: MacChannel) -> Iterator[Any]:
+                yield channel.name
+
+            return StreamTo[MacChannel](get_stream_id, get_epg_id, get_name).populate(
+                _decode_channels(raws, _mac_channel_decoder), MacChannel
+            )
+    except (msgspec.MsgspecError, ValueError):
+        pass
     return None
 
 
-def m3u_stream_to(channels: Any) -> Optional[StreamTo]:
+def m3u_stream_to(response: http.Response) -> Optional[StreamTo]:
     try:
 
         def get_stream_id(channel: IPTVChannel) -> Any:
@@ -97,11 +144,12 @@ def m3u_stream_to(channels: Any) -> Optional[StreamTo]:
             yield channel.attributes.get("tvg-name")
             yield channel.name
 
-        channels = playlist.loads(channels)
-        return StreamTo[IPTVChannel](get_stream_id, get_epg_id, get_name).populate(channels, IPTVChannel)
-    except IPyTVException as error:
+        if text := response.text:
+            channels = playlist.loads(text)
+            return StreamTo[IPTVChannel](get_stream_id, get_epg_id, get_name).populate(channels, IPTVChannel)
+    except (IPyTVException, ValueError) as error:
         logger.error("%s: %s", error.__class__.__name__, error)
-        return None
+    return None
 
 
 class EPGserverChannels:
@@ -111,15 +159,16 @@ class EPGserverChannels:
         APItype.M3U: m3u_stream_to,
     }
 
-    def __init__(self, server: str, channels: Any, api: APItype) -> None:
+    def __init__(self, server: str, response: http.Response, api: APItype, workers: CpuWorkers) -> None:
+        """the response is decoded by a worker"""
         self.stream_to: Optional[StreamTo] = None
         self.stream_to_lock = threading.Lock()
-        threading.Thread(target=self._populate, args=(channels, api, server)).start()
+        workers.submit(self._populate, response, api, server)
 
-    def _populate(self, channels: Any, api: APItype, server: str) -> None:
+    def _populate(self, response: http.Response, api: APItype, server: str) -> None:
         logger.info("Set channels for %s", server)
         if _stream_to_get := EPGserverChannels._stream_to_get.get(api):
-            if stream_to := _stream_to_get(channels):
+            if stream_to := _stream_to_get(response):
                 with self.stream_to_lock:
                     self.stream_to = stream_to
                 logger.info("%d channels found for %s", len(stream_to.epgs), server)
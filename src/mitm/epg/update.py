@@ -1,10 +1,14 @@
 # pylint: disable=c-extension-no-member
-import gzip
+import collections
+import hashlib
 import logging
 import multiprocessing
+import os
 import re
 import tempfile
-from contextlib import contextmanager
+import threading
+import zlib
+from concurrent.futures.process import BrokenProcessPool
 from enum import Enum, auto, member
 from pathlib import Path
 from typing import IO, Callable, Container, Iterator, NamedTuple, Optional, Self
@@ -16,9 +20,11 @@ from thefuzz import fuzz, process
 
 from shared.job_runner import JobRunner
 
+from ..cache_janitor import CacheJanitor
 from ..utils import ProgressStep
-from .cache import ChannelProgrammes, ChannelsCache, NamedProgrammes, ProgrammesT
-from .programme import InternalProgramme
+from ..xmltv import InternalProgramme, XmltvParser, XmltvSplitError, iter_xmltv
+from .cache import ChannelProgrammes, ChannelsCache, NamedProgrammes, ProgrammesT, XmltvInfo, XmltvValidators
+from .parse import parse_in_parallel
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +54,197 @@ class EPGProcess(NamedTuple):
     stopping: StoppingT
 
 
+class EpgConfig(NamedTuple):
+    requests_timeout: int
+    parse_workers: int
+
+
+class XmltvStopped(Exception):
+    """the epg process is stopping"""
+
+
+class XmltvStream:
+    """
+    the xmltv is downloaded & hashed by a thread while it's read to be parsed
+    a gzipped one is decompressed by the thread too, its fingerprint is the decompressed xmltv's
+    so that it's parsed as soon as its first chunks are there
+    at most _queued_chunks are waiting in memory to be read, the others are spilled to a temp file
+    so that the download is never slowed down by the parsing and its fingerprint is known at network speed
+    it's a conditional request if there are validators, it's not downloaded if it's not modified
+    """
+
+    _chunk_size = 1024 * 128
+    _queued_chunks = 64
+
+    def __init__(
+        self, url: str, epg_process: EPGProcess, timeout: int, validators: Optional[XmltvValidators] = None
+    ) -> None:
+        self._url = url
+        self._gzipped = url.endswith(".gz")
+        self._epg_process = epg_process
+        self._timeout = timeout
+        self._validators = validators
+        self._responded = threading.Event()
+        self._not_modified = False
+        self.validators = XmltvValidators()
+        self._queued = threading.Condition()
+        self._chunks: collections.deque[bytes] = collections.deque()
+        self._spill: Optional[IO[bytes]] = None
+        self._spilled = 0
+        self._spill_read = 0
+        self._done = False
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._closed = threading.Event()
+        self._downloaded = threading.Event()
+        self._error: Optional[Exception] = None
+        self._fingerprint: Optional[str] = None
+        self._thread = threading.Thread(target=self._download, name="Epg download")
+
+    def __enter__(self) -> Self:
+        self._epg_process.update_status(EPGProgress(EPGstatus.DOWNLOADING))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._closed.set()
+        self._thread.join()
+        if self._spill:
+            self._spill.close()
+
+    def _chunks_from_url(self) -> Iterator[bytes]:
+        if (xml := Path(self._url)).is_file():  # for debug purpose
+            self._responded.set()
+            with xml.open("rb") as f:
+                yield from iter(lambda: f.read(XmltvStream._chunk_size), b"")
+            return
+        headers = self._validators.conditional_headers() if self._validators else None
+        with requests.get(self._url, headers=headers, stream=True, timeout=self._timeout) as response:
+            response.raise_for_status()
+            self.validators = XmltvValidators.from_headers(response.headers)
+            if response.status_code == requests.codes.not_modified:
+                self._not_modified = True
+                return
+            self._responded.set()
+            # the last one if it's not told
+            total_size = self.validators.content_length or (self._validators and self._validators.content_length)
+            progress_step = ProgressStep(total=total_size) if total_size else None
+            for i, chunk in enumerate(response.iter_content(chunk_size=XmltvStream._chunk_size)):
+                if progress_step and (progress := progress_step.progress(i * XmltvStream._chunk_size)):
+                    self._epg_process.update_status(EPGProgress(EPGstatus.DOWNLOADING, progress))
+                yield chunk
+
+    @staticmethod
+    def _gunzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """all its members, zero padded or not, as GzipFile does"""
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            while chunk:
+                if decompressor.eof:  # next member
+                    if not (chunk := chunk.lstrip(b"\x00")):
+                        break
+                    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                yield decompressor.decompress(chunk)
+                chunk = decompressor.unused_data
+        if not decompressor.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+    def _put(self, chunk: bytes) -> None:
+        """never blocks, once a chunk is spilled all the next ones are to keep them in order"""
+        with self._queued:
+            if self._spill is None and len(self._chunks) < XmltvStream._queued_chunks:
+                self._chunks.append(chunk)
+            else:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile()
+                self._spill.seek(self._spilled)
+                self._spill.write(chunk)
+                self._spilled += len(chunk)
+            self._queued.notify()
+
+    def _get(self) -> Optional[bytes]:
+        """blocks till there's a chunk, None once they've all been read"""
+        with self._queued:
+            while True:
+                if self._chunks:
+                    return self._chunks.popleft()
+                if self._spill and self._spill_read < self._spilled:
+                    self._spill.seek(self._spill_read)
+                    chunk = self._spill.read(min(XmltvStream._chunk_size, self._spilled - self._spill_read))
+                    self._spill_read += len(chunk)
+                    return chunk
+                if self._done:
+                    return None
+                self._queued.wait()
+
+    def _download(self) -> None:
+        # the fastest of hashlib, it's not for security
+        fingerprint = hashlib.sha1(usedforsecurity=False)
+        try:
+            chunks = self._chunks_from_url()
+            for chunk in self._gunzip(chunks) if self._gzipped else chunks:
+                if not chunk:
+                    continue
+                if self._epg_process.stopping() or self._closed.is_set():
+                    self._error = XmltvStopped()
+                    break
+                fingerprint.update(chunk)
+                self._put(chunk)
+            else:
+                if not self._not_modified:
+                    self._fingerprint = fingerprint.hexdigest()
+        except (requests.RequestException, ConnectionError, OSError, zlib.error, EOFError) as error:
+            self._error = error
+        finally:
+            self._responded.set()
+            self._downloaded.set()
+            with self._queued:
+                self._done = True
+                self._queued.notify()
+
+    def read(self, size: int = -1) -> bytes:
+        """blocks till the chunks are downloaded, the download error is raised when it's reached"""
+        while not self._buffer and not self._eof:
+            if (chunk := self._get()) is None:
+                self._eof = True
+            else:
+                self._buffer = memoryview(chunk)
+        if self._eof and not self._buffer:
+            if self._error:
+                raise self._error
+            return b""
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, memoryview(b"")
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return bytes(data)
+
+    @property
+    def downloaded(self) -> bool:
+        return self._downloaded.is_set() and not self._error
+
+    def not_modified(self) -> bool:
+        """once it's responded"""
+        self._responded.wait()
+        return self._not_modified
+
+    def fingerprint(self) -> str:
+        """of the whole xmltv, once it's been downloaded"""
+        self._downloaded.wait()
+        if self._error:
+            raise self._error
+        assert self._fingerprint
+        return self._fingerprint
+
+    def info(self) -> XmltvInfo:
+        return XmltvInfo(self.fingerprint(), self.validators)
+
+    def update_processing(self, progress: EPGProgress) -> None:
+        """the processing progress is shown once the downloading progress isn't"""
+        if self._downloaded.is_set():
+            self._epg_process.update_status(progress)
+
+
 def _normalize(name: str) -> str:
     # turn channel.2 into channel2
     name = re.sub(r"(\.)([\d]+)", r"\2", name)
@@ -70,51 +267,55 @@ def _valid_url(url: str) -> bool:
         return False
 
 
-def parse_programme(file_obj: IO[bytes] | gzip.GzipFile, epg_process: EPGProcess) -> Iterator[NamedProgrammes]:
+def parse_programme(
+    file_obj: IO[bytes] | XmltvStream, epg_process: EPGProcess, parser: XmltvParser
+) -> Iterator[NamedProgrammes]:
     current_programmes: list[InternalProgramme] = []
     current_channel_id: Optional[str] = None
     normalized: dict[str, str] = {}
     progress_step = ProgressStep()
-    elem: ET.ElementBase
-    title: str = ""
-    desc: str = ""
-    for _, elem in ET.iterparse(
-        file_obj,
-        events=("end",),
-        tag=("channel", "programme", "title", "desc"),
-        remove_blank_text=True,
-        remove_comments=True,
-        remove_pis=True,
-    ):
-        match elem.tag:
-            case "channel":
-                if channel_id := elem.get("id", None):
-                    progress_step.increment_total(1)
-                    normalized[channel_id] = _normalize(channel_id)
-            case "title":  # child of <programme>
-                title = elem.text or ""
-            case "desc":  # child of <programme>
-                desc = elem.text or ""
-            case "programme":
-                if norm_channel_id := normalized.get(elem.get("channel", None)):
-                    if norm_channel_id != current_channel_id:
-                        if current_channel_id and current_programmes:
-                            yield NamedProgrammes(tuple(current_programmes), current_channel_id)
-                        current_programmes = []
-                        current_channel_id = norm_channel_id
-                        if progress := progress_step.increment_progress(1):
-                            epg_process.update_status(EPGProgress(EPGstatus.PROCESSING, progress))
-                    start = elem.get("start", "")
-                    stop = elem.get("stop", "")
-                    programme = InternalProgramme(start=start, stop=stop, title=title, desc=desc)
-                    current_programmes.append(programme)
-                title = ""
-                desc = ""
-        elem.clear(False)
+    for item in iter_xmltv(file_obj, parser):
+        if isinstance(item, str):
+            progress_step.increment_total(1)
+            normalized[item] = _normalize(item)
+        else:
+            channel_id, programme = item
+            if norm_channel_id := normalized.get(channel_id):
+                if norm_channel_id != current_channel_id:
+                    if current_channel_id and current_programmes:
+                        yield NamedProgrammes(tuple(current_programmes), current_channel_id)
+                    current_programmes = []
+                    current_channel_id = norm_channel_id
+                    if progress := progress_step.increment_progress(1):
+                        epg_process.update_status(EPGProgress(EPGstatus.PROCESSING, progress))
+                current_programmes.append(programme)
     if current_channel_id and current_programmes:
         yield NamedProgrammes(tuple(current_programmes), current_channel_id)
 
 
+def parse_programme_parallel(
+    xmltv: XmltvStream, epg_process: EPGProcess, workers: int, parser: XmltvParser
+) -> Iterator[NamedProgrammes]:
+    """
+    the same channels in the same order as parse_programme, the programmes are already pickled by the workers
+    a channel cut by a fragment boundary is saved in two parts
+    """
+    current_channel_id: Optional[str] = None
+    normalized: dict[str, str] = {}
+    progress_step = ProgressStep()
+    for fragment in parse_in_parallel(xmltv.read, workers, EPGupdate.fragment_size, parser):
+        for item in fragment:
+            if isinstance(item, str):
+                progress_step.increment_total(1)
+                normalized[item] = _normalize(item)
+            elif norm_channel_id := normalized.get(item.channel_id):
+                if norm_channel_id != current_channel_id:
+                    current_channel_id = norm_channel_id
+                    if progress := progress_step.increment_progress(1):
+                        epg_process.update_status(EPGProgress(EPGstatus.PROCESSING, progress))
+                yield NamedProgrammes(item.programmes, norm_channel_id)
+
+
 class FoundProgammes(NamedTuple):
     list: ProgrammesT
     confidence: int
@@ -189,69 +390,87 @@ class FuzzBest:
 
 
 class EPGupdate(NamedTuple):
-    _chunk_size = 1024 * 128
     url: str
     status: EPGstatus
     programmes: Optional[ChannelProgrammes] = None
 
-    @contextmanager
-    @staticmethod
-    def _load_xml(url: str, epg_process: EPGProcess, timeout: int) -> Iterator[Optional[Path]]:
-        epg_process.update_status(EPGProgress(EPGstatus.DOWNLOADING))
-        if (xml := Path(url)).is_file():  # for debug purpose
-            yield xml
-            return
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with requests.get(url, stream=True, timeout=timeout) as response:
-                response.raise_for_status()
-                xml = Path(temp_dir) / "xml"
-                with xml.open(mode="wb") as f:
-                    total_size = int(response.headers.get("Content-Length", 0))
-                    progress_step = ProgressStep(total=total_size) if total_size else None
-                    for i, chunk in enumerate(response.iter_content(chunk_size=EPGupdate._chunk_size)):
-                        if epg_process.stopping():
-                            yield None
-                            return
-                        if progress_step and (progress := progress_step.progress(i * EPGupdate._chunk_size)):
-                            epg_process.update_status(EPGProgress(EPGstatus.DOWNLOADING, progress))
-                        f.write(chunk)
-                yield xml
+    # the xmltv is parsed by the configured number of worker processes if there are enough cores
+    # one core is left for the download & the merge
+    fragment_size = 1024 * 1024 * 4
+    max_workers = 8
+    # no element is built with the target parser
+    parser = XmltvParser.TARGET
 
     @classmethod
-    def _process(cls, xml: Path, url: str, epg_process: EPGProcess) -> Iterator[Optional[NamedProgrammes]]:
-        stopped = False
-        epg_process.update_status(EPGProgress(EPGstatus.PROCESSING))
-        with gzip.GzipFile(xml) if url.endswith(".gz") else xml.open("rb") as f:
-            for named_programmes in parse_programme(f, epg_process):
-                if epg_process.stopping():
-                    stopped = True
-                    break
-                yield named_programmes
-        if stopped:
-            yield None  # we're sure xml is freed before yielding the stop
+    def _workers(cls, parse_workers: int) -> int:
+        return min(parse_workers, (os.cpu_count() or 1) - 1, cls.max_workers)
+
+    @classmethod
+    def _process(
+        cls, xmltv: XmltvStream, epg_process: EPGProcess, parse_workers: int
+    ) -> Iterator[NamedProgrammes]:
+        """while it's downloading"""
+        processing = EPGProcess(xmltv.update_processing, epg_process.stopping)
+        if (workers := cls._workers(parse_workers)) >= 2:
+            yield from parse_programme_parallel(xmltv, processing, workers, cls.parser)
+        else:
+            yield from parse_programme(xmltv, processing, cls.parser)
 
     @classmethod
     def _get(
-        cls, url: str, cache: ChannelsCache, epg_process: EPGProcess, timeout: int
+        cls, url: str, cache: ChannelsCache, epg_process: EPGProcess, config: EpgConfig
     ) -> Optional[ChannelProgrammes]:
         try:
-            with cls._load_xml(url, epg_process, timeout) as xml:
-                if not xml:
-                    return None
-                epg_process.update_status(EPGProgress(EPGstatus.LOAD_CACHE))
-                if programmes := cache.load(xml, url):
-                    logger.info("%s Epg channels from '%s' loaded in cache", programmes.number, url)
-                    return programmes
-                if channels := cls._process(xml, url, epg_process):
+            epg_process.update_status(EPGProgress(EPGstatus.LOAD_CACHE))
+            cached = cache.load(url)
+            validators = cached.xmltv.validators if cached else None
+            with XmltvStream(url, epg_process, config.requests_timeout, validators) as xmltv:
+                if cached and xmltv.not_modified():
+                    logger.info("%s Epg channels from '%s' not modified, loaded in cache", cached.number, url)
+                    return cached
+                unchanged = False
+
+                def is_cached() -> bool:
+                    return bool(cached and cached.xmltv.fingerprint == xmltv.fingerprint())
+
+                def channels() -> Iterator[Optional[NamedProgrammes]]:
+                    nonlocal unchanged
+                    checked = False
+                    for named_programmes in cls._process(xmltv, epg_process, config.parse_workers):
+                        if epg_process.stopping():
+                            yield None
+                            return
+                        # the processing stops as soon as the xmltv is downloaded if it's the cached one
+                        if not checked and xmltv.downloaded:
+                            checked = True
+                            if unchanged := is_cached():
+                                yield None
+                                return
+                            epg_process.update_status(EPGProgress(EPGstatus.PROCESSING))
+                        yield named_programmes
+                    if not checked and (unchanged := is_cached()):
+                        yield None
+                        return
                     epg_process.update_status(EPGProgress(EPGstatus.SAVE_CACHE))
-                    if programmes := cache.save(xml, url, channels):
-                        logger.info("%s Epg channels from '%s' saved in cache", programmes.number, url)
-                        return programmes
+
+                if programmes := cache.save(url, channels(), xmltv.info):
+                    logger.info("%s Epg channels from '%s' saved in cache", programmes.number, url)
+                    return programmes
+                if unchanged and cached:
+                    logger.info("%s Epg channels from '%s' loaded in cache", cached.number, url)
+                    if (info := xmltv.info()) != cached.xmltv:
+                        cache.update_xmltv(url, cached, info)
+                    return cached
+        except XmltvStopped:
+            pass
         except (
             requests.RequestException,
             ConnectionError,
-            gzip.BadGzipFile,
+            OSError,
+            zlib.error,
             ET.ParseError,
+            XmltvSplitError,
+            BrokenProcessPool,
             EOFError,
             BufferError,
         ) as error:
@@ -259,11 +478,13 @@ class EPGupdate(NamedTuple):
         return None
 
     @classmethod
-    def from_url(cls, url: str, cache: ChannelsCache, epg_process: EPGProcess, timeout: int) -> Optional[Self]:
+    def from_url(
+        cls, url: str, cache: ChannelsCache, epg_process: EPGProcess, config: EpgConfig
+    ) -> Optional[Self]:
         if url:
             if _valid_url(url) or Path(url).is_file():
                 logger.info("Load epg channels from '%s'", url)
-                if (programmes := cls._get(url, cache, epg_process, timeout)) is not None:
+                if (programmes := cls._get(url, cache, epg_process, config)) is not None:
                     epg_process.update_status(EPGProgress(EPGstatus.READY))
                     return cls(url, EPGstatus.READY, programmes)
                 epg_process.update_status(EPGProgress(EPGstatus.FAILED))
@@ -289,13 +510,13 @@ class EPGupdate(NamedTuple):
 
 
 class EPGupdater(JobRunner[str]):
-    def __init__(self, roaming: Path, update_status: UpdateStatusT, timeout: int) -> None:
+    def __init__(self, janitor: CacheJanitor, update_status: UpdateStatusT, config: EpgConfig) -> None:
         self.epg_process = EPGProcess(update_status, self.stopping)
         self._update_has_failed = multiprocessing.Event()
         self._update_lock = multiprocessing.Lock()
         self._update: Optional[EPGupdate] = None
-        self._cache = ChannelsCache(roaming)
-        self._timeout = timeout
+        self._cache = ChannelsCache(janitor)
+        self._config = config
         super().__init__(self._updating, "Epg updater", check_new=self._check_new)
 
     def _check_new(self, url: str, last_url: Optional[str]) -> bool:
@@ -304,7 +525,7 @@ class EPGupdater(JobRunner[str]):
 
     def _updating(self, url: str) -> None:
         self._update_has_failed.clear()
-        if update := EPGupdate.from_url(url, self._cache, self.epg_process, self._timeout):
+        if update := EPGupdate.from_url(url, self._cache, self.epg_process, self._config):
             with self._update_lock:
                 self._update = update
                 if update.status == EPGstatus.FAILED:
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import requests
+import urllib3
+from mitmproxy import http
+from mitmproxy.proxy.mode_specs import UpstreamMode
+
+from .utils import set_query_key
+
+# the upstream servers certificates are not verified, as the proxy does
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+logger = logging.getLogger(__name__)
+OnPageT = Callable[[http.Response, int], Awaitable[bool]]
+
+
+class Fetcher:
+    """replay a flow's request with the same headers & cookies through the same upstream proxy"""
+
+    _skipped_headers = "accept-encoding", "content-length"
+
+    def __init__(self, flow: http.HTTPFlow, timeout: int) -> None:
+        self.flow = flow.copy()
+        self.timeout = timeout
+        mode = flow.client_conn.proxy_mode
+        self.proxies = {"http": mode.data, "https": mode.data} if isinstance(mode, UpstreamMode) else None
+
+    def _fetch(self, request: http.Request) -> Optional[http.Response]:
+        headers = {
+            key: value for key, value in request.headers.items() if key.lower() not in Fetcher._skipped_headers
+        }
+        try:
+            with requests.request(
+                request.method,
+                request.url,
+                headers=headers,
+                data=request.content or None,
+                proxies=self.proxies,
+                timeout=self.timeout,
+                verify=False,
+            ) as response:
+                response.raise_for_status()
+                return http.Response.make(
+                    response.status_code,
+                    response.content,
+                    {"Content-Type": response.headers.get("Content-Type", "application/json")},
+                )
+        except requests.RequestException as error:
+            logger.warning("%s: %s", error.__class__.__name__, error)
+            return None
+
+    async def fetch(self, **query: str) -> Optional[http.Response]:
+        """the flow's request with its query updated"""
+        flow = self.flow.copy()
+        for key, value in query.items():
+            set_query_key(flow, key, value)
+        return await asyncio.to_thread(self._fetch, flow.request)
+
+
+class PagesPrefetcher:
+    """fetch pages with a bounded number of concurrent requests, pages are handled in order"""
+
+    def __init__(self, workers: int, timeout: int) -> None:
+        self.workers = workers
+        self.timeout = timeout
+
+    async def prefetch(self, flow: http.HTTPFlow, first_page: int, last_page: int, on_page: OnPageT) -> bool:
+        """returns False if a page couldn't be fetched, on_page returns True to stop"""
+        fetcher = Fetcher(flow, self.timeout)
+        pages = iter(range(first_page, last_page + 1))
+        window: deque[tuple[int, asyncio.Task[Optional[http.Response]]]] = deque()
+
+        def fill_window() -> None:
+            while len(window) < self.workers and (page := next(pages, None)) is not None:
+                window.append((page, asyncio.create_task(fetcher.fetch(p=str(page)))))
+
+        try:
+            fill_window()
+            while window:
+                page, task = window.popleft()
+                if not (response := await task):
+                    logger.warning("Can't prefetch page %s from %s", page, flow.request.host_header)
+                    return False
+                if await on_page(response, page):
+                    break
+                fill_window()
+            return True
+        finally:
+            for _, task in window:
+                task.cancel()
@@ -0,0 +1,171 @@
+import functools
+import itertools
+import pickle
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import IO, Any, Iterator, NamedTuple, Optional, Self
+
+from .utils import clear_by_chunks, sorted_by_chunks
+
+_split = re.compile(r"\W+")
+
+
+@functools.lru_cache(maxsize=2**16)
+def _strip_accents(token: str) -> str:
+    return "".join(char for char in unicodedata.normalize("NFKD", token) if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> list[str]:
+    """casefolded tokens without accents"""
+    return [
+        token if token.isascii() else _strip_accents(token) for token in _split.split(text.casefold()) if token
+    ]
+
+
+class SearchField(NamedTuple):
+    key: str
+    weight: int
+
+
+class SearchIndex:
+    """
+    persistent inverted index of items tokens
+    a posting is an item index and its token weight packed in an int
+    there's no object for each token's postings that the GC would track & walk through on each full collection:
+    they're built in bytearrays and loaded end to end in one array
+    """
+
+    fields = (
+        SearchField("name", 4),
+        SearchField("o_name", 2),
+        SearchField("actors", 1),
+        SearchField("year", 1),
+    )
+    _weight_bits = 4
+    _weight_mask = (1 << _weight_bits) - 1
+    _min_prefix = 2
+    _version = 2
+    _tokens_chunk = 2**13
+
+    _posting_size = 4
+
+    def __init__(self) -> None:
+        # built item by item
+        self.postings: dict[str, bytearray] = {}
+        # loaded, the sorted tokens & where their postings start
+        self.tokens: list[str] = []
+        self.starts = array("Q")
+        self.all_postings = array("I")
+        self.actual: int = 0
+        self.timestamp: float = 0
+
+    def add(self, index: int, item: Any) -> None:
+        """item has the fields as attributes"""
+        weights: dict[str, int] = {}
+        for field in SearchIndex.fields:
+            if value := getattr(item, field.key, None):
+                for token in set(tokenize(str(value))):
+                    weights[token] = weights.get(token, 0) + field.weight
+        index <<= SearchIndex._weight_bits
+        postings = self.postings
+        for token, weight in weights.items():
+            if (token_postings := postings.get(token)) is None:
+                token_postings = postings[token] = bytearray()
+            token_postings += (index | min(weight, SearchIndex._weight_mask)).to_bytes(
+                SearchIndex._posting_size, sys.byteorder
+            )
+
+    def _matching(self, token: str) -> Iterator[int]:
+        """the indexes of the token itself and of the tokens it prefixes"""
+        tokens = self.tokens
+        first = bisect_left(tokens, token)
+        if len(token) < SearchIndex._min_prefix:
+            if first < len(tokens) and tokens[first] == token:
+                yield first
+            return
+        for i in range(first, len(tokens)):
+            if not tokens[i].startswith(token):
+                break
+            yield i
+
+    def _token_scores(self, token: str) -> dict[int, int]:
+        scores: dict[int, int] = {}
+        for matched in self._matching(token):
+            # exact matches rank higher than prefix matches
+            bonus = 2 if self.tokens[matched] == token else 1
+            for posting in self.all_postings[self.starts[matched] : self.starts[matched + 1]]:
+                index = posting >> SearchIndex._weight_bits
+                score = (posting & SearchIndex._weight_mask) * bonus
+                if score > scores.get(index, 0):
+                    scores[index] = score
+        return scores
+
+    def search(self, query: str) -> list[int]:
+        """items indexes matching all the query tokens, the best ranked first"""
+        scores: Optional[dict[int, int]] = None
+        for token in tokenize(query):
+            token_scores = self._token_scores(token)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    index: score + token_scores[index] for index, score in scores.items() if index in token_scores
+                }
+            if not scores:
+                return []
+        if not scores:
+            return []
+        # ties keep the catalog order
+        return sorted(scores, key=lambda index: (-scores[index], index))
+
+    def clear(self) -> None:
+        clear_by_chunks(self.postings)
+
+    def dump(self, file: IO[bytes], actual: int, timestamp: float) -> None:
+        """
+        the sorted tokens & their postings counts are followed by the postings end to end
+        a pickled dict of arrays is slow and holds the GIL all along
+        the tokens are joined by chunks with a separator they can't have
+        """
+        tokens = list(sorted_by_chunks(list(self.postings)))
+        pickle.dump(SearchIndex._version, file)
+        pickle.dump(actual, file)
+        pickle.dump(timestamp, file)
+        pickle.dump(len(tokens), file)
+        for start in range(0, len(tokens), SearchIndex._tokens_chunk):
+            pickle.dump("\n".join(tokens[start : start + SearchIndex._tokens_chunk]), file)
+        size = SearchIndex._posting_size
+        pickle.dump(array("I", (len(self.postings[token]) // size for token in tokens)), file)
+        for token in tokens:
+            file.write(self.postings[token])
+
+    @staticmethod
+    def _load_tokens(file: IO[bytes], n_tokens: int) -> list[str]:
+        tokens: list[str] = []
+        while len(tokens) < n_tokens and isinstance(joined := pickle.load(file), str):
+            tokens.extend(joined.split("\n"))
+        return tokens
+
+    @classmethod
+    def load(cls, file: IO[bytes], actual: int, timestamp: float) -> Optional[Self]:
+        """None if it doesn't match the catalog"""
+        if (
+            pickle.load(file) == SearchIndex._version
+            and pickle.load(file) == actual
+            and pickle.load(file) == timestamp
+            and isinstance(n_tokens := pickle.load(file), int)
+            and len(tokens := cls._load_tokens(file, n_tokens)) == n_tokens
+            and isinstance(counts := pickle.load(file), array)
+            and len(counts) == n_tokens
+        ):
+            index = cls()
+            index.all_postings.frombytes(file.read(SearchIndex._posting_size * sum(counts)))
+            index.starts = array("Q", itertools.accumulate(counts, initial=0))
+            index.tokens = tokens
+            index.actual = actual
+            index.timestamp = timestamp
+            return index
+        return None
@@ -1,5 +1,7 @@
+import heapq
+import re
 from enum import Enum, auto
-from typing import Any, Optional
+from typing import Any, Callable, Iterator, Optional, Self, Sequence, TypeVar
 
 import msgspec
 from mitmproxy import http
@@ -7,6 +9,8 @@ from mitmproxy.coretypes.multidict import MultiDictView
 
 json_decoder = msgspec.json.Decoder()
 json_encoder = msgspec.json.Encoder()
+T = TypeVar("T")
+_json_whitespaces = re.compile(rb"[ \t\n\r]*")
 
 
 class APItype(Enum):
@@ -19,29 +23,115 @@ def _query(request: http.Request) -> MultiDictView[str, str]:
     return request.urlencoded_form if request.method == "POST" else request.query
 
 
-def del_query_key(flow: http.HTTPFlow, key: str) -> None:
-    del _query(flow.request)[key]
-
-
-def get_query_key(flow: http.HTTPFlow, key: str) -> Optional[str]:
-    return _query(flow.request).get(key)
-
-
-def content_json(content: Optional[bytes]) -> Any:
+def content_json(content: Optional[bytes], decoder: msgspec.json.Decoder = json_decoder) -> Any:
     try:
-        if content and (json_ := json_decoder.decode(content)):
+        if content and (json_ := decoder.decode(content)):
             return json_
     except msgspec.MsgspecError:
         pass
     return None
 
 
-def response_json(response: Optional[http.Response]) -> Any:
-    if response and (json_ := content_json(response.content)):
+def response_json(response: Optional[http.Response], decoder: msgspec.json.Decoder = json_decoder) -> Any:
+    if response and (json_ := content_json(response.content, decoder)):
         return json_
     return None
 
 
+class FlowContext:
+    """
+    what's parsed from a flow, kept in its metadata so that it's shared by all the hooks
+    the query is parsed once & kept in sync by set_query_key & del_query_key
+    the response json is decoded once for each content & decoder, again when the content's changed
+    """
+
+    _metadata_key = "sfvip.context"
+
+    def __init__(self, query: dict[str, str]) -> None:
+        self.query = query
+        self.api: Optional[APItype] = None
+        self.api_checked = False
+        self._json_content: Optional[bytes] = None
+        self._jsons: dict[msgspec.json.Decoder, Any] = {}
+
+    @classmethod
+    def of(cls, flow: http.HTTPFlow) -> Self:
+        context = flow.metadata.get(FlowContext._metadata_key)
+        if not isinstance(context, cls):
+            # parsed once, the first value of a repeated key as MultiDictView does
+            query: dict[str, str] = {}
+            for key, value in _query(flow.request).fields:
+                query.setdefault(key, value)
+            context = flow.metadata[FlowContext._metadata_key] = cls(query)
+        return context
+
+    @property
+    def action(self) -> Optional[str]:
+        return self.query.get("action")
+
+    def response_json(
+        self, response: Optional[http.Response], decoder: msgspec.json.Decoder = json_decoder
+    ) -> Any:
+        """the decoded json is shared, it should be encoded back in the response once modified"""
+        if not response:
+            return None
+        if (content := response.raw_content) is not self._json_content or content is None:
+            self._jsons = {}
+            self._json_content = content
+        if decoder not in self._jsons:
+            self._jsons[decoder] = response_json(response, decoder)
+        return self._jsons[decoder]
+
+    def __deepcopy__(self, memo: dict[int, Any]) -> Self:
+        """for a flow copy, that has the same request but not its response"""
+        context = self.__class__(self.query.copy())
+        context.api, context.api_checked = self.api, self.api_checked
+        return context
+
+
+def del_query_key(flow: http.HTTPFlow, key: str) -> None:
+    del _query(flow.request)[key]
+    FlowContext.of(flow).query.pop(key, None)
+
+
+def set_query_key(flow: http.HTTPFlow, key: str, value: str) -> None:
+    _query(flow.request)[key] = value
+    FlowContext.of(flow).query[key] = value
+
+
+def get_query_key(flow: http.HTTPFlow, key: str) -> Optional[str]:
+    return FlowContext.of(flow).query.get(key)
+
+
+def _skip_whitespaces(content: bytes, pos: int) -> int:
+    match = _json_whitespaces.match(content, pos)
+    return match.end() if match else pos
+
+
+def json_array_insert(
+    content: bytes, array_start: int, before: Sequence[msgspec.Raw], item: bytes
+) -> Optional[bytes]:
+    """
+    splice an encoded item in the json array that starts @ array_start, right after the before items
+    they're walked over to find where to insert, None if they're not found there
+    """
+    if content[array_start : array_start + 1] != b"[":
+        return None
+    pos = array_start + 1
+    for i, raw in enumerate(before):
+        pos = _skip_whitespaces(content, pos)
+        if i and content[pos : pos + 1] == b",":
+            pos = _skip_whitespaces(content, pos + 1)
+        if not content.startswith(bytes(raw), pos):
+            return None
+        pos += len(raw)
+    if before:
+        return b"%b,%b%b" % (content[:pos], item, content[pos:])
+    next_pos = _skip_whitespaces(content, pos)
+    separator = b"" if content[next_pos : next_pos + 1] == b"]" else b","
+    return b"%b%b%b%b" % (content[:pos], item, separator, content[pos:])
+
+
 def get_int(text: Optional[str | int]) -> Optional[int]:
     try:
         if text:
@@ -78,3 +168,26 @@ class ProgressStep:
             self._last = progress
             return progress
         return None
+
+
+def sorted_by_chunks(
+    values: Sequence[T], key: Optional[Callable[[T], Any]] = None, reverse: bool = False, chunk: int = 2**12
+) -> Iterator[T]:
+    """stable, sorted by chunks & merged since a whole sort holds the GIL & stalls the event loop"""
+    chunks = [
+        sorted(values[start : start + chunk], key=key, reverse=reverse) for start in range(0, len(values), chunk)
+    ]
+    return heapq.merge(*chunks, key=key, reverse=reverse)
+
+
+def clear_by_chunks(values: list | set | dict, chunk: int = 2**12) -> None:
+    """emptied bit by bit since freeing all the values at once holds the GIL & stalls the event loop"""
+    if isinstance(values, list):
+        while values:
+            del values[-chunk:]
+    elif isinstance(values, set):
+        while values:
+            values.pop()
+    else:
+        while values:
+            values.popitem()
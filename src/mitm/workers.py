@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def started_executor(workers: int, name: str) -> ThreadPoolExecutor:
+    """
+    all its threads are started right away and not on demand
+    since starting a thread waits for the GIL that might be held by another one
+    """
+    executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+    barrier = threading.Barrier(workers)
+    for _ in range(workers):
+        executor.submit(barrier.wait)
+    return executor
+
+
+class CpuWorkers:
+    """
+    the api responses are decoded & rewritten off the event loop
+    the hook awaits them or not while the loop keeps relaying the streams
+    the threads are created in the proxy process
+    """
+
+    _workers = 2
+
+    def __init__(self) -> None:
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        self._executor = started_executor(CpuWorkers._workers, "Cpu worker")
+
+    def stop(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def run(self, work: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, work, *args)
+
+    def submit(self, work: Callable[..., Any], *args: Any) -> None:
+        """not awaited, no thread is started once the workers are there"""
+        if self._executor:
+            self._executor.submit(work, *args)
@@ -0,0 +1,222 @@
+# pylint: disable=c-extension-no-member
+# use a separate named package to reduce what's imported by the xmltv workers processes
+import io
+import pickle
+import re
+from enum import Enum, member
+from typing import IO, Callable, Iterator, NamedTuple, Optional, Protocol
+
+import lxml.etree as ET
+
+
+class InternalProgramme(NamedTuple):
+    start: str
+    stop: str
+    title: str
+    desc: str
+
+
+# a channel id or a programme with its channel id, in the xmltv order
+XmltvItemT = str | tuple[str, InternalProgramme]
+ReadT = Callable[[int], bytes]
+_feed_size = 1024 * 64
+
+
+class Readable(Protocol):
+    def read(self, size: int = -1) -> bytes: ...
+
+
+def _iterparse(file_obj: IO[bytes] | Readable) -> Iterator[XmltvItemT]:
+    """the elements are built & cleared, the emptied ones are still kept by the root"""
+    elem: ET.ElementBase
+    title: str = ""
+    desc: str = ""
+    for _, elem in ET.iterparse(
+        file_obj,
+        events=("end",),
+        tag=("channel", "programme", "title", "desc"),
+        remove_blank_text=True,
+        remove_comments=True,
+        remove_pis=True,
+    ):
+        match elem.tag:
+            case "channel":
+                if channel_id := elem.get("id", None):
+                    yield channel_id
+            case "title":  # child of <programme>
+                title = elem.text or ""
+            case "desc":  # child of <programme>
+                desc = elem.text or ""
+            case "programme":
+                if channel_id := elem.get("channel", None):
+                    start = elem.get("start", "")
+                    stop = elem.get("stop", "")
+                    yield channel_id, InternalProgramme(start=start, stop=stop, title=title, desc=desc)
+                title = ""
+                desc = ""
+        elem.clear(False)
+
+
+class _XmltvTarget:
+    """the parser's callbacks, the items are built right away without any element"""
+
+    def __init__(self) -> None:
+        self.items: list[XmltvItemT] = []
+        self._programme: dict[str, str] = {}
+        self._title = ""
+        self._desc = ""
+        # the text of <title> or <desc> before any child, as elem.text
+        self._text: list[str] = []
+        self._in_text = False
+
+    def start(self, tag: str, attrib: dict[str, str]) -> None:
+        match tag:
+            case "title" | "desc":
+                self._text = []
+                self._in_text = True
+            case "programme":
+                self._programme = attrib
+                self._in_text = False
+            case "channel":
+                if channel_id := attrib.get("id", None):
+                    self.items.append(channel_id)
+                self._in_text = False
+            case _:
+                self._in_text = False
+
+    def data(self, data: str) -> None:
+        if self._in_text:
+            self._text.append(data)
+
+    def end(self, tag: str) -> None:
+        match tag:
+            case "title":  # child of <programme>
+                self._title = "".join(self._text)
+                self._in_text = False
+            case "desc":  # child of <programme>
+                self._desc = "".join(self._text)
+                self._in_text = False
+            case "programme":
+                if channel_id := self._programme.get("channel", None):
+                    start = self._programme.get("start", "")
+                    stop = self._programme.get("stop", "")
+                    programme = InternalProgramme(start=start, stop=stop, title=self._title, desc=self._desc)
+                    self.items.append((channel_id, programme))
+                self._title = ""
+                self._desc = ""
+
+    def close(self) -> None:
+        pass
+
+
+def _target_parse(file_obj: IO[bytes] | Readable) -> Iterator[XmltvItemT]:
+    """fed by chunks, the items are given back after each one, the memory used doesn't grow with the xmltv"""
+    target = _XmltvTarget()
+    parser = ET.XMLParser(target=target)
+    while chunk := file_obj.read(_feed_size):
+        parser.feed(chunk)
+        items, target.items = target.items, []
+        yield from items
+    parser.close()
+    yield from target.items
+
+
+class XmltvParser(Enum):
+    """both give the same items"""
+
+    ITERPARSE = member(_iterparse)
+    TARGET = member(_target_parse)
+
+
+def iter_xmltv(file_obj: IO[bytes] | Readable, parser: XmltvParser) -> Iterator[XmltvItemT]:
+    return parser.value(file_obj)
+
+
+class XmltvSplitError(Exception):
+    """the xmltv can't be split or one of its fragments can't be parsed"""
+
+
+class PickledRun(NamedTuple):
+    """consecutive programmes of a channel, pickled as they're stored"""
+
+    channel_id: str
+    programmes: bytes
+
+
+FragmentT = list[str | PickledRun]
+
+
+def parse_fragment(header: bytes, fragment: bytes, parser: XmltvParser) -> FragmentT:
+    """in a worker process, the channels ids & the runs in the xmltv order"""
+    parsed: FragmentT = []
+    run_id: Optional[str] = None
+    run: list[InternalProgramme] = []
+
+    def flush() -> None:
+        if run_id and run:
+            parsed.append(PickledRun(run_id, pickle.dumps(tuple(run))))
+
+    try:
+        for item in iter_xmltv(io.BytesIO(b"%b%b</tv>" % (header, fragment)), parser):
+            if isinstance(item, str):
+                flush()
+                run_id, run = None, []
+                parsed.append(item)
+            else:
+                channel_id, programme = item
+                if channel_id != run_id:
+                    flush()
+                    run_id, run = channel_id, []
+                run.append(programme)
+        flush()
+    except ET.ParseError as error:
+        # lxml errors don't go through a process boundary
+        raise XmltvSplitError(f"{error.__class__.__name__}: {error}") from None
+    return parsed
+
+
+class XmltvSplitter:
+    """
+    the xmltv is cut right after a </programme> in fragments of about fragment_size
+    each one is parsed after the header (everything up to <tv ...>) so that it's a whole document
+    """
+
+    _root_start = re.compile(rb"<tv[\s>]")
+    _root_end = b"</tv>"
+    _programme_end = b"</programme>"
+
+    def __init__(self, read: ReadT, fragment_size: int) -> None:
+        self._read = read
+        self._fragment_size = fragment_size
+        self.header = b""
+
+    def _split_header(self, data: bytes) -> bytes:
+        if (match := XmltvSplitter._root_start.search(data)) and (end := data.find(b">", match.start())) != -1:
+            self.header = data[: end + 1]
+            return data[end + 1 :]
+        raise XmltvSplitError("No <tv> root in the xmltv")
+
+    def fragments(self) -> Iterator[bytes]:
+        pending: list[bytes] = []
+        pending_size = 0
+        has_header = False
+        while chunk := self._read(self._fragment_size):
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= self._fragment_size:
+                data = b"".join(pending)
+                if not has_header:
+                    data = self._split_header(data)
+                    has_header = True
+                if (cut := data.rfind(XmltvSplitter._programme_end)) != -1:
+                    cut += len(XmltvSplitter._programme_end)
+                    yield data[:cut]
+                    data = data[cut:]
+                pending, pending_size = [data], len(data)
+        data = b"".join(pending)
+        if not has_header:
+            data = self._split_header(data)
+        end = data.rfind(XmltvSplitter._root_end)
+        if end == -1 or data[end + len(XmltvSplitter._root_end) :].strip():
+            raise XmltvSplitError("The xmltv ended before its </tv>")
+        yield data[:end]
@@ -5,8 +5,8 @@ from urllib.parse import urlparse, urlsplit, urlunsplit
 
 from translations.loc import LOC
 
-from ..mitm.addon import AddonAllConfig, AllCategoryName, EpgCallbacks, SfVipAddOn
-from ..mitm.cache import AllCached
+from ..mitm.addon import AddonAllConfig, AllCategoryName, EpgCallbacks, EpgConfig, SfVipAddOn
+from ..mitm.cache import AllCached, CacheConfig
 from ..mitm.proxies import MitmLocalProxy, Mode, validate_upstream
 from ..winapi import mutex
 from .accounts import AccountsProxies
@@ -51,7 +51,7 @@ def _fix_upstream(url: str) -> Optional[str]:
     return None
 
 
-def get_all_config(player_capabilities: PlayerCapabilities) -> AddonAllConfig:
+def get_all_config(player_capabilities: PlayerCapabilities, app_info: AppInfo) -> AddonAllConfig:
     return AddonAllConfig(
         AllCategoryName(
             live=None if player_capabilities.has_all_channels else LOC.AllChannels,
@@ -66,6 +66,15 @@ def get_all_config(player_capabilities: PlayerCapabilities) -> AddonAllConfig:
             fast_cached=LOC.FastCached,
             all_names={"vod": LOC.AllMovies, "series": LOC.AllSeries},
         ),
+        CacheConfig(
+            page_size=app_info.config.AllCache.page_size,
+            prefetch_workers=app_info.config.AllCache.prefetch_workers,
+            requests_timeout=app_info.config.AllCache.requests_timeout,
+            live_max_hours=app_info.config.AllCache.live_max_hours,
+            budget_mb=app_info.config.AllCache.budget_mb,
+            compression=app_info.config.AllCache.compression,
+            compression_level=app_info.config.AllCache.compression_level,
+        ),
     )
 
 
@@ -91,7 +100,7 @@ class LocalProxies:
         self._cache_progress = CacheProgressListener(ui, self.cache_stop_all)
         self._addon = SfVipAddOn(
             accounts_proxies.urls,
-            get_all_config(player_capabilities),
+            get_all_config(player_capabilities, app_info),
             app_info.roaming,
             EpgCallbacks(
                 self._epg_updater.update_status,
@@ -99,7 +108,10 @@ class LocalProxies:
                 self._epg_updater.add_show_epg,
             ),
             self._cache_progress.update_progress,
-            app_info.config.EPG.requests_timeout,
+            EpgConfig(
+                requests_timeout=app_info.config.EPG.requests_timeout,
+                parse_workers=app_info.config.EPG.parse_workers,
+            ),
         )
         self._upstreams = accounts_proxies.upstreams
         self._by_upstreams: dict[str, str] = {}